@@ -0,0 +1,514 @@
+import collections
+import itertools
+import multiprocessing
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import ss_timing.conf
+import ss_timing.psi
+
+
+# likelihood tables for each grid, built once per worker process
+_tables = {}
+
+# how often the main process wakes while waiting for results, so that it can
+# be interrupted
+_result_poll_s = 1.0
+
+# the package modules whose import times are measured by default
+_package_modules = [
+    "ss_timing.conf",
+    "ss_timing.psi",
+    "ss_timing.data",
+    "ss_timing.index",
+    "ss_timing.bench",
+    "ss_timing.exp",
+    "ss_timing.sim",
+    "ss_timing.display",
+    "ss_timing.instruct",
+    "ss_timing.practice",
+    "ss_timing.stim"
+]
+
+# third-party modules that are slow to import
+_heavy_modules = [
+    "psychopy",
+    "pyglet",
+    "matplotlib",
+    "scipy",
+    "PIL",
+    "stimuli",
+    "exp_input"
+]
+
+# run in a new interpreter to time a single import
+_import_timer = """
+import sys
+import time
+start = time.time()
+import {module:s}
+duration = time.time() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print "import_time", repr(duration), " ".join(loaded)
+"""
+
+
+def run(
+    out_path,
+    n_trials_per_stair=(40,),
+    n_stairs_per_run=(2,),
+    n_x_levels=(350,),
+    n_alpha_levels=(350,),
+    n_beta_levels=(50,),
+    n_reps=1000,
+    alpha=0.05,
+    beta=3.0,
+    seed=0,
+    n_procs=None
+):
+
+    configs = list(
+        itertools.product(
+            n_trials_per_stair,
+            n_stairs_per_run,
+            n_x_levels,
+            n_alpha_levels,
+            n_beta_levels
+        )
+    )
+
+    (_, dt, formats) = get_bench_dtype()
+
+    done = set()
+
+    # carry on from where a previous, interrupted, sweep got to
+    if os.path.exists(out_path):
+
+        prev_results = load_results(out_path)
+
+        done.update(
+            (
+                tuple(int(prev_result[name]) for name in dt.names[:5]),
+                int(prev_result["rep"])
+            )
+            for prev_result in prev_results
+        )
+
+    else:
+
+        with open(out_path, "w") as out_file:
+            out_file.write("# " + "\t".join(dt.names) + "\n")
+
+    jobs = [
+        (config, i_rep, alpha, beta, seed)
+        for config in configs
+        for i_rep in xrange(n_reps)
+        if (config, i_rep) not in done
+    ]
+
+    grids = sorted(set(job[0][2:] for job in jobs))
+
+    with open(out_path, "a") as out_file:
+
+        # each grid gets its own worker processes, so that the peak memory
+        # that they report is for that grid alone
+        for grid in grids:
+
+            grid_jobs = [job for job in jobs if job[0][2:] == grid]
+
+            # the workers ignore interrupts, which are handled by the main
+            # process terminating the pool
+            pool = multiprocessing.Pool(
+                processes=n_procs,
+                initializer=_ignore_sigint
+            )
+
+            try:
+
+                # the jobs aren't chunked, since only the unchunked iterator
+                # can be waited on with a timeout
+                results = pool.imap_unordered(_run_job, grid_jobs)
+
+                # results are written as soon as they come in, so that a long
+                # sweep can be interrupted
+                while True:
+
+                    # waiting with a timeout lets the interrupt be delivered
+                    try:
+                        result = results.next(timeout=_result_poll_s)
+
+                    except multiprocessing.TimeoutError:
+                        continue
+
+                    except StopIteration:
+                        break
+
+                    out_file.write(
+                        "\t".join(
+                            fmt % value
+                            for (fmt, value) in zip(formats, result)
+                        ) +
+                        "\n"
+                    )
+                    out_file.flush()
+
+            except:
+
+                pool.terminate()
+                pool.join()
+
+                raise
+
+            pool.close()
+            pool.join()
+
+    return summarise(load_results(out_path), alpha=alpha, beta=beta)
+
+
+def _ignore_sigint():
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def compare_precision(
+    conf,
+    dtype=np.float32,
+    log_domain=True,
+    n_reps=100,
+    alpha=0.05,
+    beta=3.0,
+    seed=0
+):
+
+    # runs staircases with the given precision alongside the standard
+    # double-precision staircases, with both receiving the same sequence of
+    # random draws for the simulated observer
+
+    ref_tables = ss_timing.psi.calc_tables(
+        alpha_levels=conf.alpha_levels,
+        beta_levels=conf.beta_levels,
+        stim_levels=conf.x_levels,
+        psych_func=conf.psych_func
+    )
+
+    test_tables = [table.astype(dtype) for table in ref_tables]
+
+    n_same_levels = 0
+
+    est_diffs = []
+
+    for i_rep in xrange(n_reps):
+
+        psis = [
+            ss_timing.psi.Psi(
+                alpha_levels=conf.alpha_levels,
+                beta_levels=conf.beta_levels,
+                stim_levels=conf.x_levels,
+                p_corr=p_corr,
+                h_corr=h_corr,
+                dtype=psi_dtype,
+                log_domain=psi_log_domain
+            )
+            for ((p_corr, h_corr), psi_dtype, psi_log_domain) in zip(
+                (ref_tables, test_tables),
+                (np.float64, dtype),
+                (False, log_domain)
+            )
+        ]
+
+        _ = [psi.step() for psi in psis]
+
+        rand = np.random.RandomState(seed + i_rep)
+
+        for _ in xrange(conf.n_trials_per_stair):
+
+            draw = rand.uniform()
+
+            levels = [psi.get_curr_stim_level() for psi in psis]
+
+            n_same_levels += (levels[0] == levels[1])
+
+            for (psi, level) in zip(psis, levels):
+
+                psi.update(
+                    draw < conf.psych_func(x=level, alpha=alpha, beta=beta)
+                )
+                psi.step()
+
+        (ref_est, test_est) = [psi.get_estimates() for psi in psis]
+
+        est_diffs.append(np.array(test_est) - np.array(ref_est))
+
+    est_diffs = np.array(est_diffs)
+
+    comparison = collections.OrderedDict(
+        [
+            (
+                "prop_same_levels",
+                float(n_same_levels) / (n_reps * conf.n_trials_per_stair)
+            ),
+            ("alpha_max_abs_diff", np.max(np.abs(est_diffs[:, 0]))),
+            ("beta_max_abs_diff", np.max(np.abs(est_diffs[:, 1]))),
+            ("alpha_mean_diff", np.mean(est_diffs[:, 0])),
+            ("beta_mean_diff", np.mean(est_diffs[:, 1]))
+        ]
+    )
+
+    return comparison
+
+
+def time_imports(module_names=None, n_reps=5):
+
+    if module_names is None:
+        module_names = _package_modules
+
+    import_times = collections.OrderedDict()
+
+    for module_name in module_names:
+
+        code = _import_timer.format(module=module_name, heavy=_heavy_modules)
+
+        durations = []
+        loaded = set()
+        error = None
+
+        for _ in xrange(n_reps):
+
+            # each import is in a new interpreter, so that nothing has been
+            # imported beforehand
+            try:
+                output = subprocess.check_output(
+                    [sys.executable, "-c", code],
+                    stderr=subprocess.STDOUT
+                )
+
+            except subprocess.CalledProcessError as e:
+
+                # most likely a dependency that isn't installed
+                error = e.output.strip().splitlines()[-1]
+
+                break
+
+            for line in output.splitlines():
+
+                if line.startswith("import_time"):
+
+                    line_parts = line.split()
+
+                    durations.append(float(line_parts[1]))
+                    loaded.update(line_parts[2:])
+
+        if durations:
+            (median_s, min_s) = (np.median(durations), np.min(durations))
+        else:
+            (median_s, min_s) = (np.nan, np.nan)
+
+        import_times[module_name] = collections.OrderedDict(
+            [
+                ("median_s", median_s),
+                ("min_s", min_s),
+                ("heavy_modules", sorted(loaded)),
+                ("error", error)
+            ]
+        )
+
+    return import_times
+
+
+def summarise(results, alpha, beta):
+
+    (_, dt, _) = get_bench_dtype()
+
+    config_names = dt.names[:5]
+
+    configs = set(
+        tuple(int(result[name]) for name in config_names)
+        for result in results
+    )
+
+    summary = collections.OrderedDict()
+
+    for config in sorted(configs):
+
+        in_config = np.ones(len(results), dtype=np.bool)
+
+        for (config_name, config_value) in zip(config_names, config):
+            in_config &= (results[config_name] == config_value)
+
+        config_results = results[in_config]
+
+        summary[config] = collections.OrderedDict(
+            [
+                ("n_reps", len(config_results)),
+                ("alpha_bias", np.mean(config_results["alpha_hat"]) - alpha),
+                ("alpha_var", np.var(config_results["alpha_hat"])),
+                ("beta_bias", np.mean(config_results["beta_hat"]) - beta),
+                ("beta_var", np.var(config_results["beta_hat"])),
+                ("step_time_mean", np.mean(config_results["step_time_mean"])),
+                ("step_time_max", np.max(config_results["step_time_max"])),
+                ("peak_mem_kb", np.max(config_results["peak_mem_kb"]))
+            ]
+        )
+
+    return summary
+
+
+def load_results(path):
+
+    (_, dt, _) = get_bench_dtype()
+
+    results = np.loadtxt(
+        fname=path,
+        dtype=dt,
+        delimiter="\t",
+        ndmin=1
+    )
+
+    return results
+
+
+def get_bench_dtype():
+
+    dt_info = collections.OrderedDict()
+
+    # the first five entries describe the configuration
+    dt_info["n_trials_per_stair"] = (np.uint16, "%u")
+    dt_info["n_stairs_per_run"] = (np.uint8, "%u")
+    dt_info["n_x_levels"] = (np.uint16, "%u")
+    dt_info["n_alpha_levels"] = (np.uint16, "%u")
+    dt_info["n_beta_levels"] = (np.uint16, "%u")
+    dt_info["rep"] = (np.uint32, "%u")
+    dt_info["alpha_hat"] = (np.float, "%.12g")
+    dt_info["beta_hat"] = (np.float, "%.12g")
+    dt_info["step_time_mean"] = (np.float, "%.12g")
+    dt_info["step_time_max"] = (np.float, "%.12g")
+    dt_info["peak_mem_kb"] = (np.uint64, "%u")
+
+    dt = np.dtype(
+        [
+            (dt_key, dt_entry[0])
+            for (dt_key, dt_entry) in dt_info.iteritems()
+        ]
+    )
+
+    fmt = [dt_entry[1] for dt_entry in dt_info.itervalues()]
+
+    return (dt_info, dt, fmt)
+
+
+def get_bench_conf(
+    n_trials_per_stair,
+    n_stairs_per_run,
+    n_x_levels,
+    n_alpha_levels,
+    n_beta_levels
+):
+
+    conf = ss_timing.conf.get_conf("bench", hardware=False)
+
+    conf.n_trials_per_stair = n_trials_per_stair
+    conf.n_stairs_per_run = n_stairs_per_run
+
+    # same ranges as the experiment, but with different resolutions
+    for (levels_name, n_levels) in zip(
+        ("x_levels", "alpha_levels", "beta_levels"),
+        (n_x_levels, n_alpha_levels, n_beta_levels)
+    ):
+
+        levels = getattr(conf, levels_name)
+
+        setattr(
+            conf,
+            levels_name,
+            np.logspace(
+                np.log10(levels[0]),
+                np.log10(levels[-1]),
+                n_levels
+            )
+        )
+
+    return conf
+
+
+def _run_job(job):
+
+    (config, i_rep, alpha, beta, seed) = job
+
+    conf = get_bench_conf(*config)
+
+    if config[2:] not in _tables:
+
+        # only the tables for the current grid are kept
+        _tables.clear()
+
+        _tables[config[2:]] = ss_timing.psi.calc_tables(
+            alpha_levels=conf.alpha_levels,
+            beta_levels=conf.beta_levels,
+            stim_levels=conf.x_levels,
+            psych_func=conf.psych_func,
+            dtype=conf.psi_dtype
+        )
+
+    (p_corr, h_corr) = _tables[config[2:]]
+
+    rand = np.random.RandomState(
+        hash((seed, config, i_rep)) & 0xffffffff
+    )
+
+    estimates = []
+    step_times = []
+
+    for _ in xrange(conf.n_stairs_per_run):
+
+        psi = ss_timing.psi.Psi(
+            alpha_levels=conf.alpha_levels,
+            beta_levels=conf.beta_levels,
+            stim_levels=conf.x_levels,
+            p_corr=p_corr,
+            h_corr=h_corr,
+            prune_tail=conf.psi_prune_tail,
+            prune_after=conf.psi_prune_after,
+            dtype=conf.psi_dtype,
+            log_domain=conf.psi_log_domain
+        )
+
+        psi.step()
+
+        for _ in xrange(conf.n_trials_per_stair):
+
+            p_corr_obs = conf.psych_func(
+                x=psi.get_curr_stim_level(),
+                alpha=alpha,
+                beta=beta
+            )
+
+            step_start = time.time()
+
+            psi.update(rand.uniform() < p_corr_obs)
+            psi.step()
+
+            step_times.append(time.time() - step_start)
+
+        estimates.append(psi.get_estimates())
+
+    # the staircases are combined by averaging their final estimates
+    (alpha_hat, beta_hat) = np.mean(estimates, axis=0)
+
+    # this is the peak for the worker process so far; workers only run jobs
+    # for a single grid
+    peak_mem_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return config + (
+        i_rep,
+        alpha_hat,
+        beta_hat,
+        np.mean(step_times),
+        np.max(step_times),
+        peak_mem_kb
+    )
@@ -3,19 +3,42 @@ import socket
 
 import numpy as np
 
-import psychopy.monitors
-import psychopy.misc
 
-import exp_input
-import stimuli.psi
-import stimuli.utils
+class ConfigContainer(object):
 
+    # a field can be given as a function of the config, in which case it is
+    # only worked out when it is first accessed and then kept
 
-class ConfigContainer(object):
-    pass
+    def __init__(self):
+        self._lazy_fields = {}
+
+    def set_lazy(self, name, get_value):
+        self._lazy_fields[name] = get_value
+
+    def __getattr__(self, name):
+
+        # only called if `name` isn't already an attribute
+        lazy_fields = self.__dict__.get("_lazy_fields", {})
+
+        if name not in lazy_fields:
+            raise AttributeError("Config has no field " + name)
+
+        value = lazy_fields[name](self)
+
+        setattr(self, name, value)
 
+        del lazy_fields[name]
 
-def get_conf(subj_id):
+        return value
+
+
+def get_conf(subj_id, hardware=True):
+
+    # if `hardware` is False, the host-specific paths, the input device and
+    # the monitor settings are not set up; this allows the design to be
+    # generated away from the lab machines. Even if they are, they (and
+    # PsychoPy) are only loaded when first needed, as are the fields that need
+    # the `stimuli` package
 
     conf = ConfigContainer()
 
@@ -23,21 +46,8 @@ def get_conf(subj_id):
 
     conf.study_id = "ss_timing"
 
-    data_dir = {
-        "djm_unsw": "/home/damien/venv_study/ss_timing/data",
-        "djm_1018_12": "/sci/study/ss_timing/data",
-        "djm_1018_13": "/sci/study/ss_timing/data"
-    }
-    conf.data_path = data_dir[socket.gethostname()]
-
-    image_dir = {
-        "djm_unsw": "/home/damien/venv_study/ss_timing/code/ss_timing/images",
-        "djm_1018_12": "/sci/study/ss_timing/code/ss_timing/images",
-        "djm_1018_13": "/sci/study/ss_timing/code/ss_timing/images"
-    }
-    conf.image_path = image_dir[socket.gethostname()]
-
-    conf.exp_input = exp_input.InputDevice(use_rb=False)
+    if hardware:
+        _set_hardware(conf)
 
     # surround onset conditions; pre = before target, sim = simultaneous with
     # target
@@ -61,19 +71,23 @@ def get_conf(subj_id):
 
     conf.n_trials_overall = conf.n_trials_per_run * conf.n_runs
 
-    conf.monitor_name = "1018_12_dpp"
-    conf.monitor = psychopy.monitors.Monitor(conf.monitor_name)
-    conf.monitor_res_pix = (1920, 1080)
-    conf.monitor_res_dva = [
-        psychopy.misc.pix2deg(res, conf.monitor)
-        for res in conf.monitor_res_pix
-    ]
-    conf.monitor_dpp = (
-        float(conf.monitor_res_dva[0]) /
-        conf.monitor_res_pix[0]
-    )
-    conf.monitor_mode = "mono++"
-    conf.monitor_port = "/dev/dpp"
+    conf.refresh_hz = 120.0
+
+    # the refresh is measured until the 95% confidence interval on the frame
+    # period is within `refresh_ci_ms` (after at least `refresh_min_frames`
+    # and for at most `refresh_max_frames`); frame intervals more than
+    # `refresh_outlier_ms` away from the expected period are outliers, and
+    # are left out of the estimate
+    conf.refresh_min_frames = 20
+    conf.refresh_max_frames = 120
+    conf.refresh_ci_ms = 0.05
+    conf.refresh_outlier_ms = 1000.0 / conf.refresh_hz / 2.0
+    # and then the measurement is accepted if the frame period is within
+    # `refresh_tol_ms` of that expected, its SD is less than
+    # `refresh_max_sd_ms`, and there are no more than `refresh_max_outliers`
+    conf.refresh_tol_ms = 0.15
+    conf.refresh_max_sd_ms = 0.5
+    conf.refresh_max_outliers = 1
 
     # 12 * (1/120) = 100ms
     conf.pres_frames = 12
@@ -106,53 +120,86 @@ def get_conf(subj_id):
     conf.target_cpd = 1.0
     conf.target_diam_dva = 3.0
     conf.target_ecc_dva = 5.0
-    conf.target_positions = {
-        "NE": stimuli.utils.pol_to_cart(45, conf.target_ecc_dva),
-        "NW": stimuli.utils.pol_to_cart(135, conf.target_ecc_dva),
-        "SW": stimuli.utils.pol_to_cart(225, conf.target_ecc_dva),
-        "SE": stimuli.utils.pol_to_cart(315, conf.target_ecc_dva)
-    }
+    conf.set_lazy(
+        "target_positions",
+        functools.partial(_get_positions, ecc=conf.target_ecc_dva)
+    )
 
     conf.surr_cpd = 1.0
     conf.surr_diam_dva = 20.0
     conf.surr_contrast = 0.25
 
+    # the grating phase is chosen from this many equally-spaced values, so that
+    # the gratings for each phase and surround orientation can be set up
+    # before the trials
+    conf.n_grating_phases = 16
+    conf.grating_cache_size = conf.n_grating_phases * len(conf.surr_oris)
+
     conf.fix_diam_va = 0.25
 
     fb_ecc = conf.target_ecc_dva
-    conf.fb_positions = {
-        "NE": stimuli.utils.pol_to_cart(45, fb_ecc),
-        "NW": stimuli.utils.pol_to_cart(135, fb_ecc),
-        "SW": stimuli.utils.pol_to_cart(225, fb_ecc),
-        "SE": stimuli.utils.pol_to_cart(315, fb_ecc)
-    }
+    conf.set_lazy(
+        "fb_positions",
+        functools.partial(_get_positions, ecc=fb_ecc)
+    )
 
     conf.pre_s = 0.5
     conf.fb_s = 0.5
     conf.min_iti = 2.0
 
-    conf.psych_func = functools.partial(
-        stimuli.psi.weibull,
-        lapse_rate=0.05,
-        guess_rate=0.25  # 4AFC
-    )
+    # the end of the ITI is waited for by sleeping until this long before it
+    # and then checking the clock continuously; it needs to be longer than
+    # the sleep granularity of the system
+    conf.iti_spin_s = 0.001
+
+    conf.set_lazy("psych_func", _get_psych_func)
 
-    conf.x_levels = np.logspace(
-        np.log10(0.001),
-        np.log10(1.0),
-        350
+    conf.set_lazy(
+        "x_levels",
+        functools.partial(_get_levels, lower=0.001, upper=1.0, n=350)
     )
-    conf.alpha_levels = np.logspace(
-        np.log10(0.001),
-        np.log10(1.0),
-        350
+    conf.set_lazy(
+        "alpha_levels",
+        functools.partial(_get_levels, lower=0.001, upper=1.0, n=350)
     )
-    conf.beta_levels = np.logspace(
-        np.log10(0.5),
-        np.log10(20.0),
-        50
+    conf.set_lazy(
+        "beta_levels",
+        functools.partial(_get_levels, lower=0.5, upper=20.0, n=50)
     )
 
+    # optionally restrict each staircase's grid, after a number of trials, to
+    # the region that excludes the given tail mass at either end of the
+    # alpha and beta marginals (None to always use the full grid)
+    conf.psi_prune_tail = None
+    conf.psi_prune_after = 12
+
+    # numeric precision of the staircase tables and posteriors, and whether
+    # the posteriors are accumulated as log probabilities. Single precision
+    # halves the memory for the likelihood tables. In simulations
+    # (`ss_timing.bench.compare_precision`; 100 staircases of 40 trials with
+    # alpha = 0.05 and beta = 3), float32 in the log domain chose the same
+    # stimulus level as float64 on 96% of trials; final alpha estimates
+    # differed by at most 0.01 (mean 5e-6) and beta estimates by at most 2.8
+    # (mean 0.04). The step time was not noticeably different.
+    conf.psi_dtype = np.float64
+    conf.psi_log_domain = False
+
+    # how often (in trials per staircase) to save a snapshot of the
+    # posterior, and how much of the tail mass at either end of the alpha
+    # and beta marginals can be dropped from it (None to keep the full grid)
+    conf.post_snapshot_interval = 10
+    conf.post_snapshot_tail = 1e-6
+
+    # whether to update the staircases in a background thread while the
+    # feedback is being shown
+    conf.psi_threaded = True
+
+    # screenshots are written by a background thread, either as "png" (with
+    # fast compression) or uncompressed as "npy"; at most this many frames
+    # can be waiting to be written before the trial waits for the writer
+    conf.screenshot_format = "png"
+    conf.screenshot_queue_size = 32
+
     conf.resp_map = {
         "num_8": "NE",
         "num_7": "NW",
@@ -163,3 +210,115 @@ def get_conf(subj_id):
     conf.min_time_between_runs = 30.0
 
     return conf
+
+
+def _set_hardware(conf):
+
+    conf.set_lazy("data_path", _get_data_path)
+    conf.set_lazy("image_path", _get_image_path)
+
+    conf.set_lazy("exp_input", _get_exp_input)
+
+    conf.monitor_name = "1018_12_dpp"
+    conf.set_lazy("monitor", _get_monitor)
+    conf.monitor_res_pix = (1920, 1080)
+    conf.set_lazy("monitor_res_dva", _get_monitor_res_dva)
+    conf.set_lazy("monitor_dpp", _get_monitor_dpp)
+    conf.monitor_mode = "mono++"
+    conf.monitor_port = "/dev/dpp"
+
+
+def _get_data_path(conf):
+
+    data_dir = {
+        "djm_unsw": "/home/damien/venv_study/ss_timing/data",
+        "djm_1018_12": "/sci/study/ss_timing/data",
+        "djm_1018_13": "/sci/study/ss_timing/data"
+    }
+
+    return data_dir[socket.gethostname()]
+
+
+def _get_image_path(conf):
+
+    image_dir = {
+        "djm_unsw": "/home/damien/venv_study/ss_timing/code/ss_timing/images",
+        "djm_1018_12": "/sci/study/ss_timing/code/ss_timing/images",
+        "djm_1018_13": "/sci/study/ss_timing/code/ss_timing/images"
+    }
+
+    return image_dir[socket.gethostname()]
+
+
+def _get_exp_input(conf):
+
+    import exp_input
+
+    return exp_input.InputDevice(use_rb=False)
+
+
+def _get_monitor(conf):
+
+    import psychopy.monitors
+
+    return psychopy.monitors.Monitor(conf.monitor_name)
+
+
+def _get_monitor_res_dva(conf):
+
+    import psychopy.misc
+
+    monitor_res_dva = [
+        psychopy.misc.pix2deg(res, conf.monitor)
+        for res in conf.monitor_res_pix
+    ]
+
+    return monitor_res_dva
+
+
+def _get_monitor_dpp(conf):
+
+    monitor_dpp = (
+        float(conf.monitor_res_dva[0]) /
+        conf.monitor_res_pix[0]
+    )
+
+    return monitor_dpp
+
+
+def _get_positions(conf, ecc):
+
+    import stimuli.utils
+
+    positions = {
+        "NE": stimuli.utils.pol_to_cart(45, ecc),
+        "NW": stimuli.utils.pol_to_cart(135, ecc),
+        "SW": stimuli.utils.pol_to_cart(225, ecc),
+        "SE": stimuli.utils.pol_to_cart(315, ecc)
+    }
+
+    return positions
+
+
+def _get_psych_func(conf):
+
+    import stimuli.psi
+
+    psych_func = functools.partial(
+        stimuli.psi.weibull,
+        lapse_rate=0.05,
+        guess_rate=0.25  # 4AFC
+    )
+
+    return psych_func
+
+
+def _get_levels(conf, lower, upper, n):
+
+    levels = np.logspace(
+        np.log10(lower),
+        np.log10(upper),
+        n
+    )
+
+    return levels
@@ -1,73 +1,211 @@
 import os
 import collections
+import multiprocessing
+import tempfile
+import zipfile
+import zlib
 
 import numpy as np
 
+import ss_timing.psi
 
-def gen_data_table(conf):
+
+def gen_data_table(conf, rand=None):
+
+    # `rand` can be a numpy random generator or `RandomState`; by default,
+    # the global numpy random state is used
+    if rand is None:
+        rand = np.random
 
     (_, dt, _) = get_data_dtype()
 
-    data = np.zeros(0, dtype=dt)
+    data = np.zeros(conf.n_trials_overall, dtype=dt)
 
-    run_conds = []
+    # all the (onset, ori) combinations, repeated for each run
+    (i_onsets, i_oris) = np.meshgrid(
+        np.arange(conf.n_surr_onsets),
+        np.arange(conf.n_surr_oris),
+        indexing="ij"
+    )
 
-    for _ in xrange(conf.n_runs_per_cond):
-        for i_onset in xrange(conf.n_surr_onsets):
-            for i_ori in xrange(conf.n_surr_oris):
-                run_conds.append((i_onset, i_ori))
+    run_conds = np.tile(
+        np.column_stack((i_onsets.flat, i_oris.flat)),
+        (conf.n_runs_per_cond, 1)
+    )
 
-    np.random.shuffle(run_conds)
+    run_conds = run_conds[rand.permutation(len(run_conds))]
 
     assert len(run_conds) == conf.n_runs
 
-    for (i_run, (i_onset, i_ori)) in enumerate(run_conds):
+    # expand the run conditions out to each trial
+    (i_onset, i_ori) = np.repeat(run_conds, conf.n_trials_per_run, axis=0).T
+
+    data["run_number"] = np.repeat(
+        np.arange(1, conf.n_runs + 1),
+        conf.n_trials_per_run
+    )
+
+    data["surr_onset"] = np.array(conf.surr_onsets)[i_onset]
+    data["i_surr_onset"] = i_onset
+    data["surr_ori"] = np.array(conf.surr_oris)[i_ori]
+    data["i_surr_ori"] = i_ori
+    data["target_ori"] = conf.target_ori
+    data["surr_contrast"] = conf.surr_contrast
+
+    data["target_pos"] = rand.choice(
+        a=sorted(conf.target_positions.keys()),
+        size=conf.n_trials_overall
+    )
+
+    stair_nums = np.arange(1, conf.n_stairs_per_run + 1)
 
-        run_num = i_run + 1
+    # interleave the staircases with a separate random order for each run
+    i_run_seq = np.argsort(
+        rand.uniform(size=(conf.n_runs, conf.n_trials_per_run)),
+        axis=1
+    )
 
-        run_data = np.zeros(conf.n_trials_per_run, dtype=dt)
+    run_stairs = np.repeat(stair_nums, conf.n_trials_per_stair)[i_run_seq]
 
-        run_data["run_number"] = run_num
+    # number the trials within each staircase by counting, within each
+    # run, the occurrences of each staircase so far
+    in_stair = (run_stairs[..., np.newaxis] == stair_nums)
 
-        run_data["surr_onset"] = conf.surr_onsets[i_onset]
-        run_data["i_surr_onset"] = i_onset
-        run_data["surr_ori"] = conf.surr_oris[i_ori]
-        run_data["i_surr_ori"] = i_ori
-        run_data["target_ori"] = conf.target_ori
-        run_data["surr_contrast"] = conf.surr_contrast
+    stair_trials = np.sum(np.cumsum(in_stair, axis=1) * in_stair, axis=-1)
 
-        run_data["target_pos"] = np.random.choice(
-            a=conf.target_positions.keys(),
-            size=conf.n_trials_per_run
-        )
+    data["stair_num"] = run_stairs.flat
+    data["stair_trial"] = stair_trials.flat
+
+    data["run_trial"] = np.tile(
+        np.arange(1, conf.n_trials_per_run + 1),
+        conf.n_runs
+    )
+
+    data["when"] = "-" * 26
+
+    return data
+
+
+def gen_data_tables(conf, subj_ids, seed=0):
+
+    (_, dt, _) = get_data_dtype()
+
+    tables = np.zeros((len(subj_ids), conf.n_trials_overall), dtype=dt)
+
+    for (i_subj, subj_id) in enumerate(subj_ids):
+
+        rand = np.random.RandomState(get_subj_seed(subj_id, seed))
+
+        tables[i_subj] = gen_data_table(conf, rand=rand)
+
+    return tables
+
+
+def get_subj_seed(subj_id, seed=0):
+
+    # reproducible, and independent of the other subjects in the batch
+    subj_seed = zlib.crc32("{s:d}_{p:s}".format(s=seed, p=subj_id))
+
+    return subj_seed & 0xffffffff
+
+
+def get_cond_balance(conf, tables):
+
+    run_conds = _get_run_conds(conf, tables)
+
+    n_conds = conf.n_surr_onsets * conf.n_surr_oris
+
+    # number of subjects with each condition at each run position
+    counts = np.zeros((conf.n_runs, n_conds), dtype=np.int)
+
+    for i_cond in xrange(n_conds):
+        counts[:, i_cond] = np.sum(run_conds == i_cond, axis=0)
+
+    return counts
+
+
+def _get_run_conds(conf, tables):
+
+    tables = np.atleast_2d(tables)
+
+    # one row per subject, with the condition index for each run
+    run_conds = (
+        tables["i_surr_onset"] * conf.n_surr_oris + tables["i_surr_ori"]
+    )[:, ::conf.n_trials_per_run]
+
+    return run_conds
+
+
+def check_cond_balance(conf, tables, max_deviation=None):
+
+    tables = np.atleast_2d(tables)
+
+    run_conds = _get_run_conds(conf, tables)
 
-        run_data["stair_num"] = np.repeat(
-            range(1, conf.n_stairs_per_run + 1),
-            conf.n_trials_per_stair
+    n_conds = conf.n_surr_onsets * conf.n_surr_oris
+
+    # every subject needs to have each condition the same number of times
+    for i_cond in xrange(n_conds):
+
+        if np.any(np.sum(run_conds == i_cond, axis=1) != conf.n_runs_per_cond):
+            raise ValueError("Subjects do not have a full set of conditions")
+
+    counts = get_cond_balance(conf, tables)
+
+    p_cond = 1.0 / n_conds
+
+    expected = len(tables) * p_cond
+
+    # largest proportional deviation from an even split of the conditions
+    # across the cohort, at any run position
+    deviation = np.max(np.abs(counts - expected)) / expected
+
+    # each subject's orderings are random, so by default they only need to be
+    # as balanced as would be expected by chance; this is 4.5 SDs of the
+    # number of subjects with a condition at a run position
+    if max_deviation is None:
+        max_deviation = 4.5 * np.sqrt((1.0 - p_cond) / expected)
+
+    if deviation > max_deviation:
+        raise ValueError(
+            "Condition orderings are unbalanced; deviation is " +
+            "{d:.3f}".format(d=deviation)
         )
 
-        i_run_seq = np.random.permutation(conf.n_trials_per_run)
-        run_data = run_data[i_run_seq]
+    return (counts, deviation)
 
-        for stair_num in xrange(1, conf.n_stairs_per_run + 1):
 
-            stair_trials = (run_data["stair_num"] == stair_num)
+def save_data_tables(conf, tables, subj_ids, data_path, n_procs=None):
 
-            run_data["stair_trial"][stair_trials] = range(
-                1,
-                conf.n_trials_per_stair + 1
-            )
+    paths = [
+        os.path.join(data_path, _get_data_filename(conf.study_id, subj_id))
+        for subj_id in subj_ids
+    ]
 
-        run_data["run_trial"] = range(1, conf.n_trials_per_run + 1)
+    save_args = [
+        (path, table, conf.study_id + " - " + subj_id)
+        for (path, table, subj_id) in zip(paths, tables, subj_ids)
+    ]
 
-        data = np.hstack((data, run_data))
+    pool = multiprocessing.Pool(processes=n_procs)
 
-    data["when"] = "-" * 26
+    try:
+        pool.map(_save_text_args, save_args)
+    finally:
+        pool.close()
+        pool.join()
 
-    return data
+    return paths
 
 
-def load_data(conf, path=None):
+def load_data(
+    conf,
+    path=None,
+    columns=None,
+    run_number=None,
+    completed=None,
+    use_cache=True
+):
 
     (_, dt, _) = get_data_dtype()
 
@@ -79,23 +217,250 @@ def load_data(conf, path=None):
     if not path_exists:
         raise OSError("Path " + path + " does not exist")
 
-    data = np.loadtxt(
+    if columns is None:
+        columns = dt.names
+
+    out_dt = np.dtype([(column, dt[column]) for column in columns])
+
+    if use_cache:
+
+        # the whole table is parsed once, and subsequent loads only read the
+        # requested columns from the binary cache
+        col_data = _load_cached_columns(path)
+
+        i_rows = np.ones(len(col_data["run_number"]), dtype=np.bool)
+
+        if run_number is not None:
+            i_rows &= np.in1d(
+                col_data["run_number"],
+                np.atleast_1d(run_number)
+            )
+
+        if completed is not None:
+            i_rows &= (col_data["completed"] == int(completed))
+
+        data = np.zeros(np.sum(i_rows), dtype=out_dt)
+
+        for column in columns:
+            data[column] = col_data[column][i_rows]
+
+    else:
+
+        line_filters = []
+
+        if run_number is not None:
+            line_filters.append(
+                (
+                    dt.names.index("run_number"),
+                    set(np.atleast_1d(run_number).tolist())
+                )
+            )
+
+        if completed is not None:
+            line_filters.append(
+                (dt.names.index("completed"), set([int(completed)]))
+            )
+
+        file_columns = _get_file_columns_or_default(path)
+
+        # the filters need the positions of the columns in this file, which
+        # can be from before some of the columns were added
+        line_filters = [
+            (file_columns.index(dt.names[i_field]), valid_values)
+            for (i_field, valid_values) in line_filters
+        ]
+
+        with open(path, "r") as data_file:
+
+            data = _load_text_columns(
+                fname=_filter_lines(data_file, line_filters),
+                dt=out_dt,
+                file_columns=file_columns
+            )
+
+    return data
+
+
+def _load_cached_columns(path):
+
+    (cache_path, cache_valid) = get_cache_path(path)
+
+    (_, dt, _) = get_data_dtype()
+
+    if cache_valid:
+
+        col_data = _load_cache_file(cache_path)
+
+        # a cache written before columns were added to the table is rebuilt
+        if col_data is not None:
+
+            if all(column in col_data.files for column in dt.names):
+                return col_data
+
+            col_data.close()
+
+    path_stat = os.stat(path)
+
+    data = _load_text_columns(
         fname=path,
-        dtype=dt,
-        delimiter="\t"
+        dt=dt,
+        file_columns=_get_file_columns_or_default(path)
+    )
+
+    col_data = {column: data[column] for column in dt.names}
+
+    # the cache is only an accelerator, so don't fail if it can't be written
+    # (e.g. if the data directory is read-only)
+    try:
+
+        write_atomic(
+            cache_path,
+            lambda cache_file: np.savez(
+                cache_file,
+                _source_stat=np.array([path_stat.st_mtime, path_stat.st_size]),
+                **col_data
+            )
+        )
+
+    except (IOError, OSError):
+        pass
+
+    return col_data
+
+
+def _load_cache_file(cache_path):
+
+    # a cache that can't be read (e.g. left half-written by a process that
+    # was killed) is treated as stale, and is rebuilt
+    try:
+        return np.load(cache_path)
+
+    except (IOError, ValueError, zipfile.BadZipfile):
+        return None
+
+
+def write_atomic(path, write_func):
+
+    # write to a temporary file and then move it into place, so that other
+    # processes never see a partially-written file; the temporary file is
+    # unique, so that concurrent writers don't write into the same file
+    (handle, temp_path) = tempfile.mkstemp(
+        suffix=os.path.splitext(path)[1],
+        dir=os.path.dirname(os.path.abspath(path))
+    )
+
+    try:
+
+        with os.fdopen(handle, "wb") as temp_file:
+            write_func(temp_file)
+
+        os.rename(temp_path, path)
+
+    except:
+
+        os.remove(temp_path)
+
+        raise
+
+
+def get_file_columns(path):
+
+    # the column names are the last line of the commented header that
+    # `_save_text` writes
+    header = []
+
+    with open(path, "r") as data_file:
+
+        for line in data_file:
+
+            if not line.startswith("#"):
+                break
+
+            header.append(line)
+
+    if not header:
+        return []
+
+    columns = header[-1].lstrip("#").strip().split("\t")
+
+    return columns
+
+
+def is_data_file(path):
+
+    columns = get_file_columns(path)
+
+    # needs at least the design columns, to be able to be indexed
+    return all(
+        column in columns
+        for column in ("run_number", "surr_onset", "surr_ori", "completed")
+    )
+
+
+def _get_file_columns_or_default(path):
+
+    file_columns = get_file_columns(path)
+
+    # files without a header are assumed to have the current columns
+    if not file_columns:
+        (_, dt, _) = get_data_dtype()
+        file_columns = list(dt.names)
+
+    return file_columns
+
+
+def _load_text_columns(fname, dt, file_columns):
+
+    # files written with an earlier version of the table don't have the
+    # columns that have since been added; these are left at zero
+    load_columns = [column for column in dt.names if column in file_columns]
+
+    file_data = np.loadtxt(
+        fname=fname,
+        dtype=np.dtype([(column, dt[column]) for column in load_columns]),
+        delimiter="\t",
+        usecols=[file_columns.index(column) for column in load_columns],
+        ndmin=1
     )
 
+    data = np.zeros(len(file_data), dtype=dt)
+
+    for column in load_columns:
+        data[column] = file_data[column]
+
     return data
 
 
-def save_data(conf, data, path=None):
+def _filter_lines(data_file, line_filters):
 
-    (_, dt, formats) = get_data_dtype()
+    for line in data_file:
+
+        if line.startswith("#") or not line_filters:
+            yield line
+            continue
+
+        fields = line.split("\t")
+
+        if all(
+            int(fields[i_field]) in valid_values
+            for (i_field, valid_values) in line_filters
+        ):
+            yield line
+
+
+def save_data(conf, data, path=None):
 
     if path is None:
         (path, _) = get_data_path(conf)
 
-    header = conf.study_id + " - " + conf.subj_id + "\n"
+    _save_text(path, data, conf.study_id + " - " + conf.subj_id)
+
+
+def _save_text(path, data, title):
+
+    (_, dt, formats) = get_data_dtype()
+
+    header = title + "\n"
     header += "\t".join(dt.names)
 
     np.savetxt(
@@ -107,6 +472,225 @@ def save_data(conf, data, path=None):
     )
 
 
+def _save_text_args(args):
+
+    # for use with `multiprocessing`, which needs a single argument
+    return _save_text(*args)
+
+
+def load_bin_data(conf, path=None, writable=False):
+
+    if path is None:
+        (path, path_exists) = get_bin_data_path(conf)
+    else:
+        path_exists = os.path.exists(path)
+
+    if not path_exists:
+        raise OSError("Path " + path + " does not exist")
+
+    if writable:
+        mmap_mode = "r+"
+    else:
+        mmap_mode = "r"
+
+    data = np.load(path, mmap_mode=mmap_mode)
+
+    return data
+
+
+def save_bin_data(conf, data, path=None):
+
+    if path is None:
+        (path, _) = get_bin_data_path(conf)
+
+    (_, dt, _) = get_data_dtype()
+
+    np.save(path, np.asarray(data, dtype=dt))
+
+
+def save_trial(data, i_row, trial_data):
+
+    # `data` is the writable memory-mapped table from `load_bin_data`
+    data[i_row] = trial_data
+    data.flush()
+
+
+def load_journal(conf, run_num, path=None):
+
+    if path is None:
+        (path, path_exists) = get_journal_path(conf, run_num)
+    else:
+        path_exists = os.path.exists(path)
+
+    if not path_exists:
+        raise OSError("Path " + path + " does not exist")
+
+    journal = np.load(path)
+
+    run_data = journal["run_data"]
+    posteriors = journal["posteriors"]
+
+    journal.close()
+
+    return (run_data, posteriors)
+
+
+def save_journal(conf, run_num, run_data, posteriors, path=None):
+
+    if path is None:
+        (path, _) = get_journal_path(conf, run_num)
+
+    # there is always a complete journal on disk
+    write_atomic(
+        path,
+        lambda journal_file: np.savez(
+            journal_file,
+            run_data=run_data,
+            posteriors=np.asarray(posteriors)
+        )
+    )
+
+
+def load_posteriors(conf, run_num, path=None, unpack=True):
+
+    if path is None:
+        (path, path_exists) = get_posteriors_path(conf, run_num)
+    else:
+        path_exists = os.path.exists(path)
+
+    if not path_exists:
+        raise OSError("Path " + path + " does not exist")
+
+    post_file = np.load(path)
+
+    posteriors = {}
+
+    for key in post_file.files:
+
+        # keys are of the form "stair_S_trial_T_(bounds|post)"
+        (_, stair_num, _, stair_trial, part) = key.split("_")
+
+        snapshot = posteriors.setdefault(
+            (int(stair_num), int(stair_trial)),
+            {}
+        )
+
+        snapshot[part] = post_file[key]
+
+    post_file.close()
+
+    if unpack:
+        posteriors = {
+            snapshot_key: unpack_posterior(**snapshot)
+            for (snapshot_key, snapshot) in posteriors.iteritems()
+        }
+    else:
+        posteriors = {
+            snapshot_key: (snapshot["bounds"], snapshot["post"])
+            for (snapshot_key, snapshot) in posteriors.iteritems()
+        }
+
+    return posteriors
+
+
+def save_posteriors(conf, run_num, posteriors, path=None):
+
+    if path is None:
+        (path, _) = get_posteriors_path(conf, run_num)
+
+    post_data = {}
+
+    for ((stair_num, stair_trial), (bounds, post)) in posteriors.iteritems():
+
+        key = "stair_{s:d}_trial_{t:d}_".format(s=stair_num, t=stair_trial)
+
+        post_data[key + "bounds"] = bounds
+        post_data[key + "post"] = post
+
+    write_atomic(
+        path,
+        lambda post_file: np.savez(post_file, **post_data)
+    )
+
+
+def pack_posterior(posterior, tail=None):
+
+    post = np.asarray(posterior, dtype=np.float32)
+
+    (n_alpha, n_beta) = post.shape
+
+    if tail is None:
+        bounds = [0, n_alpha, 0, n_beta]
+    else:
+        bounds = list(ss_timing.psi.get_mass_bounds(post, tail))
+
+    bounds = np.array(bounds + [n_alpha, n_beta], dtype=np.uint32)
+
+    post = post[bounds[0]:bounds[1], bounds[2]:bounds[3]].copy()
+
+    return (bounds, post)
+
+
+def unpack_posterior(bounds, post):
+
+    posterior = np.zeros(bounds[4:], dtype=np.float32)
+
+    posterior[bounds[0]:bounds[1], bounds[2]:bounds[3]] = post
+
+    return posterior
+
+
+def get_frame_summary(run_data):
+
+    run_data = run_data[run_data["completed"] == 1]
+
+    soas = run_data["target_onset_time"] - run_data["surr_onset_time"]
+
+    frame_summary = {
+        "max_jitter": np.max(run_data["max_frame_jitter"]),
+        "n_dropped": int(np.sum(run_data["n_dropped_frames"])),
+        "min_soa": np.min(soas),
+        "max_soa": np.max(soas)
+    }
+
+    return frame_summary
+
+
+def append_frame_intervals(path, run_trial, frame_intervals):
+
+    path_exists = os.path.exists(path)
+
+    with open(path, "a") as frames_file:
+
+        if not path_exists:
+            frames_file.write(
+                "# run_trial, then the interval (s) between each flip from " +
+                "the last pre-stimulus flip to the response screen flip\n"
+            )
+
+        frames_file.write(
+            "\t".join(
+                ["%u" % run_trial] +
+                ["%.12g" % interval for interval in frame_intervals]
+            ) +
+            "\n"
+        )
+
+
+def load_frame_intervals(path):
+
+    frames = np.loadtxt(path, delimiter="\t", ndmin=2)
+
+    run_trials = frames[:, 0].astype(np.uint16)
+
+    # a trial that was repeated after an interruption appears more than
+    # once, and the last is the one that counts
+    (_, i_last) = np.unique(run_trials[::-1], return_index=True)
+    i_last = len(run_trials) - 1 - i_last
+
+    return (run_trials[i_last], frames[i_last, 1:])
+
+
 def get_data_dtype():
 
     # we care about insertion order
@@ -220,6 +804,83 @@ def get_data_dtype():
         "description": "Psi beta estimate after trial"
     }
 
+    dt_info["n_dropped_frames"] = {
+        "dt": np.uint16,
+        "fmt": "%u",
+        "description": "Number of frames dropped in the stimulus train"
+    }
+
+    dt_info["max_frame_jitter"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": """
+Largest difference between a stimulus train frame interval and the nominal
+frame interval, in seconds
+        """
+    }
+
+    dt_info["surr_onset_time"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "Surround onset, relative to train start, in seconds"
+    }
+
+    dt_info["target_onset_time"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "Target onset, relative to train start, in seconds"
+    }
+
+    dt_info["target_offset_time"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "Target offset, relative to train start, in seconds"
+    }
+
+    dt_info["psi_time"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "Staircase update and step duration, in seconds"
+    }
+
+    dt_info["iti"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": """
+Time from the start of the previous trial in the run to the start of this
+trial, in seconds; 0 for the first trial of a run
+        """
+    }
+
+    dt_info["refresh_ms"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "Measured frame period for the run, in ms"
+    }
+
+    dt_info["refresh_sd_ms"] = {
+        "dt": np.float,
+        "fmt": "%.12g",
+        "description": "SD of the measured frame intervals for the run, in ms"
+    }
+
+    dt_info["refresh_n_frames"] = {
+        "dt": np.uint16,
+        "fmt": "%u",
+        "description": """
+Number of frame intervals in the refresh measurement for the run, excluding
+any outliers
+        """
+    }
+
+    dt_info["refresh_n_outliers"] = {
+        "dt": np.uint16,
+        "fmt": "%u",
+        "description": """
+Number of outlying frame intervals in the refresh measurement for the run
+        """
+    }
+
     dt_info["completed"] = {
         "dt": np.uint8,
         "fmt": "%u",
@@ -250,12 +911,114 @@ def get_data_path(conf):
 
     run_path = os.path.join(
         conf.data_path,
-        "{s:s}_{p:s}.txt".format(
+        _get_data_filename(conf.study_id, conf.subj_id)
+    )
+
+    run_path_exists = os.path.exists(run_path)
+
+    return (run_path, run_path_exists)
+
+
+def get_bin_data_path(conf):
+
+    bin_path = os.path.join(
+        conf.data_path,
+        "{s:s}_{p:s}.npy".format(
             s=conf.study_id,
             p=conf.subj_id
         )
     )
 
-    run_path_exists = os.path.exists(run_path)
+    bin_path_exists = os.path.exists(bin_path)
 
-    return (run_path, run_path_exists)
+    return (bin_path, bin_path_exists)
+
+
+def get_journal_path(conf, run_num):
+
+    journal_path = os.path.join(
+        conf.data_path,
+        "{s:s}_{p:s}_run_{r:02d}_journal.npz".format(
+            s=conf.study_id,
+            p=conf.subj_id,
+            r=run_num
+        )
+    )
+
+    journal_path_exists = os.path.exists(journal_path)
+
+    return (journal_path, journal_path_exists)
+
+
+def get_posteriors_path(conf, run_num):
+
+    post_path = os.path.join(
+        conf.data_path,
+        "{s:s}_{p:s}_run_{r:02d}_posteriors.npz".format(
+            s=conf.study_id,
+            p=conf.subj_id,
+            r=run_num
+        )
+    )
+
+    post_path_exists = os.path.exists(post_path)
+
+    return (post_path, post_path_exists)
+
+
+def _get_data_filename(study_id, subj_id):
+
+    return "{s:s}_{p:s}.txt".format(s=study_id, p=subj_id)
+
+
+def get_cache_path(path):
+
+    (path_base, _) = os.path.splitext(path)
+
+    cache_path = path_base + "_cache.npz"
+
+    cache_valid = os.path.exists(cache_path)
+
+    # the cache is only valid if the text file hasn't changed since
+    if cache_valid:
+
+        path_stat = os.stat(path)
+
+        cache_file = _load_cache_file(cache_path)
+
+        if cache_file is None:
+            cache_valid = False
+
+        else:
+
+            try:
+                source_stat = cache_file["_source_stat"]
+
+            except (KeyError, ValueError, zipfile.BadZipfile):
+                source_stat = None
+
+            cache_file.close()
+
+            cache_valid = (
+                source_stat is not None and
+                source_stat[0] == path_stat.st_mtime and
+                source_stat[1] == path_stat.st_size
+            )
+
+    return (cache_path, cache_valid)
+
+
+def get_frames_path(conf, run_num):
+
+    frames_path = os.path.join(
+        conf.data_path,
+        "{s:s}_{p:s}_run_{r:02d}_frames.tsv".format(
+            s=conf.study_id,
+            p=conf.subj_id,
+            r=run_num
+        )
+    )
+
+    frames_path_exists = os.path.exists(frames_path)
+
+    return (frames_path, frames_path_exists)
@@ -0,0 +1,238 @@
+import collections
+
+import numpy as np
+
+# the rendering stack is only imported once a display is actually used, so
+# that `MonitorError` is available without it
+
+
+class MonitorError(Exception):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class Display(object):
+
+    # owns the window and the Bits# device, so that they can be opened once
+    # and then shared by the instructions, practice, and experimental runs
+
+    def __init__(self, conf, bits_mode=True):
+
+        self.conf = conf
+        self.bits_mode = bits_mode
+
+        self.win = None
+        self.bits = None
+
+        self.refresh = None
+
+        self._stim = None
+
+    def __enter__(self):
+
+        self.open()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
+
+    def open(self):
+
+        import pyglet
+        import psychopy.logging
+        psychopy.logging.console.setLevel(psychopy.logging.CRITICAL)
+        import psychopy.visual
+        import psychopy.hardware.crs
+
+        self.win = psychopy.visual.Window(
+            size=self.conf.monitor_res_pix,
+            monitor=self.conf.monitor_name,
+            fullscr=True,
+            allowGUI=False,
+            autoLog=False,
+            units="deg",
+            gamma=1.0,
+            useFBO=True,
+            waitBlanking=False  # HACK
+        )
+
+        if self.bits_mode:
+
+            self.bits = psychopy.hardware.crs.BitsSharp(
+                win=self.win,
+                mode=self.conf.monitor_mode,
+                gamma="hardware",
+                portName=self.conf.monitor_port
+            )
+            self.bits.temporalDithering = False
+
+            pyglet.gl.glColorMask(1, 1, 0, 1)
+
+    def close(self):
+
+        if self.bits is not None:
+
+            import pyglet
+
+            self.bits.mode = "auto++"
+            self.bits.com.close()
+
+            pyglet.gl.glColorMask(1, 1, 1, 1)
+
+        if self.win is not None:
+            self.win.close()
+
+        self.win = None
+        self.bits = None
+
+        # these all belong to the window
+        self.refresh = None
+        self._stim = None
+
+    def get_stim(self):
+
+        import ss_timing.stim
+
+        # the stimuli are only made once for each window
+        if self._stim is None:
+
+            self._stim = ss_timing.stim.get_stim(conf=self.conf, win=self.win)
+
+            self._stim["gratings"].build_all()
+
+        return self._stim
+
+    def check_refresh(self, max_attempts=3, recheck=False):
+
+        # the refresh only needs to be measured once for each window, unless
+        # asked to check it again
+        if self.refresh is not None and not recheck:
+            return self.refresh
+
+        for _ in xrange(max_attempts):
+
+            refresh = measure_refresh(self.conf, self.win)
+
+            if refresh["valid"]:
+
+                self.refresh = refresh
+
+                return self.refresh
+
+        # if none of the frames were near the expected refresh, the mean over
+        # all of them is the only measurement there is
+        if refresh["n_frames"] == 0:
+
+            raise MonitorError(
+                (
+                    "Monitor refresh was detected as {n:.03f} ms " +
+                    "(all {o:d} frames were outliers)"
+                ).format(
+                    n=refresh["ms_mean_all"],
+                    o=refresh["n_outliers"]
+                )
+            )
+
+        raise MonitorError(
+            (
+                "Monitor refresh was detected as {n:.03f} ms " +
+                "(SD {sd:.03f} ms; {f:d} frames; {o:d} outliers)"
+            ).format(
+                n=refresh["ms_mean"],
+                sd=refresh["ms_sd"],
+                f=refresh["n_frames"],
+                o=refresh["n_outliers"]
+            )
+        )
+
+
+def measure_refresh(conf, win):
+
+    import psychopy.core
+
+    expected_ms = 1000.0 / conf.refresh_hz
+
+    # running mean and sum of squared deviations of the frame intervals
+    (n_frames, ms_mean, ms_ss) = (0, 0.0, 0.0)
+
+    n_outliers = 0
+
+    # all the frame intervals, including the outliers
+    ms_sum_all = 0.0
+
+    timer = psychopy.core.Clock()
+
+    win.flip()
+
+    prev_flip_time = timer.getTime()
+
+    for _ in xrange(conf.refresh_max_frames):
+
+        win.flip()
+
+        flip_time = timer.getTime()
+
+        interval_ms = (flip_time - prev_flip_time) * 1000.0
+
+        prev_flip_time = flip_time
+
+        ms_sum_all += interval_ms
+
+        if np.abs(interval_ms - expected_ms) > conf.refresh_outlier_ms:
+
+            n_outliers += 1
+
+            if n_outliers > conf.refresh_max_outliers:
+                break
+
+            continue
+
+        n_frames += 1
+
+        delta = interval_ms - ms_mean
+        ms_mean += delta / n_frames
+        ms_ss += delta * (interval_ms - ms_mean)
+
+        if n_frames >= conf.refresh_min_frames:
+
+            ci_ms = 1.96 * np.sqrt(ms_ss / (n_frames - 1) / n_frames)
+
+            if ci_ms < conf.refresh_ci_ms:
+                break
+
+    # with no frames, there isn't a measurement rather than one of zero
+    if n_frames == 0:
+        ms_mean = np.nan
+
+    if n_frames > 1:
+        ms_sd = np.sqrt(ms_ss / (n_frames - 1))
+    else:
+        ms_sd = np.nan
+
+    ms_mean_all = ms_sum_all / (n_frames + n_outliers)
+
+    valid = (
+        n_frames >= conf.refresh_min_frames and
+        n_outliers <= conf.refresh_max_outliers and
+        np.abs(ms_mean - expected_ms) < conf.refresh_tol_ms and
+        ms_sd < conf.refresh_max_sd_ms
+    )
+
+    refresh = collections.OrderedDict(
+        [
+            ("ms_mean", ms_mean),
+            ("ms_sd", ms_sd),
+            ("ms_mean_all", ms_mean_all),
+            ("n_frames", n_frames),
+            ("n_outliers", n_outliers),
+            ("valid", valid)
+        ]
+    )
+
+    return refresh
@@ -1,32 +1,171 @@
 import datetime
 import os
+import Queue
+import threading
+import time
 
 import numpy as np
-import scipy.misc
 
-import pyglet
-import psychopy.logging
-psychopy.logging.console.setLevel(psychopy.logging.CRITICAL)
-import psychopy.visual
-import psychopy.event
-import psychopy.core
-import psychopy.hardware.crs
-
-import stimuli.psychopy_ext
-import stimuli.psi
+# psychopy, pyglet and PIL are imported within the functions that use them,
+# so that the simulations can use this module without loading the rendering
+# stack
 
 import ss_timing.conf
 import ss_timing.data
-import ss_timing.stim
+import ss_timing.display
+import ss_timing.psi
+
+
+# raised when the monitor refresh isn't as expected; lives with the display
+MonitorError = ss_timing.display.MonitorError
+
+
+class _PsiUpdate(threading.Thread):
+
+    def __init__(self, psi, correct):
+
+        super(_PsiUpdate, self).__init__()
+
+        # don't hold up the interpreter exiting if the run is aborted
+        self.daemon = True
+
+        self.psi = psi
+        self.correct = correct
+        self.duration = None
+        self.error = None
+
+    def run(self):
+
+        timer = _Clock()
+
+        # kept to be raised in the main thread, as it would otherwise only be
+        # printed
+        try:
+            self.psi.update(self.correct)
+            self.psi.step()
+
+        except Exception as error:
+            self.error = error
+
+        self.duration = timer.getTime()
+
+
+class _Clock(object):
+
+    # the same interface as `psychopy.core.Clock`, for the parts of the trial
+    # loop that are shared with the simulations
+
+    def __init__(self):
+
+        self.reset()
+
+    def reset(self):
+
+        self._start = time.time()
+
+    def getTime(self):
+
+        return time.time() - self._start
+
+
+class _ScreenshotWriter(threading.Thread):
+
+    def __init__(self, frame_size, img_format="png", max_queued=0):
+
+        super(_ScreenshotWriter, self).__init__()
+
+        if img_format not in ("png", "npy"):
+            raise ValueError("Unknown screenshot format " + img_format)
+
+        self.daemon = True
+
+        self.img_format = img_format
+        self.queue = Queue.Queue()
+        self.error = None
+
+        # frames are read into these buffers, which are handed back once the
+        # frame has been written; they are made up front, unless there is no
+        # limit on how many frames can be waiting
+        (width, height) = frame_size
+
+        self.frame_shape = (height, width)
+
+        self.free_buffers = Queue.Queue()
+
+        if max_queued > 0:
+
+            self.max_buffers = max_queued + 1
+
+            for _ in xrange(self.max_buffers):
+                self.free_buffers.put(np.empty(self.frame_shape, np.uint8))
+
+        else:
+            self.max_buffers = None
+
+    def get_buffer(self):
+
+        if self.error is not None:
+            raise self.error
+
+        try:
+            return self.free_buffers.get_nowait()
+
+        except Queue.Empty:
 
+            if self.max_buffers is None:
+                return np.empty(self.frame_shape, np.uint8)
 
-class MonitorError(Exception):
+        # blocks if the writer has fallen too far behind
+        return self.free_buffers.get()
 
-    def __init__(self, value):
-        self.value = value
+    def put(self, path_base, frame):
 
-    def __str__(self):
-        return repr(self.value)
+        if self.error is not None:
+            raise self.error
+
+        self.queue.put((path_base, frame))
+
+    def close(self):
+
+        self.queue.put(None)
+        self.join()
+
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+
+        import PIL.Image
+
+        while True:
+
+            item = self.queue.get()
+
+            if item is None:
+                break
+
+            (path_base, frame) = item
+
+            # keep emptying the queue after an error, so nothing waits on it
+            if self.error is None:
+
+                try:
+
+                    # the rows are read from the bottom of the window
+                    img = np.ascontiguousarray(frame[::-1, ...])
+
+                    if self.img_format == "npy":
+                        np.save(path_base + ".npy", img)
+                    else:
+                        PIL.Image.fromarray(img).save(
+                            path_base + ".png",
+                            compress_level=1
+                        )
+
+                except Exception as error:
+                    self.error = error
+
+            self.free_buffers.put(frame)
 
 
 def run(
@@ -35,37 +174,222 @@ def run(
     wait_to_start=True,
     wait_at_end=True,
     show_finish=False,
-    screenshots=False
+    screenshots=False,
+    resume=False,
+    display=None
 ):
 
     conf = ss_timing.conf.get_conf(subj_id=subj_id)
 
-    (_, data_exists) = ss_timing.data.get_data_path(conf)
+    data = _get_bin_data(conf)
 
-    # if the path doesn't exist, then generate a new table
-    if not data_exists:
-        data = ss_timing.data.gen_data_table(conf)
-    else:
-        data = ss_timing.data.load_data(conf)
+    _run_run(
+        conf,
+        data,
+        run_num,
+        wait_to_start=wait_to_start,
+        wait_at_end=wait_at_end,
+        show_finish=show_finish,
+        screenshots=screenshots,
+        resume=resume,
+        display=display
+    )
+
+
+def run_session(
+    subj_id,
+    start_run=1,
+    end_run=None,
+    screenshots=False,
+    max_attempts=3,
+    display=None,
+    resume=False
+):
+
+    # runs each of the runs in turn, with the display, stimuli and staircase
+    # tables set up once for the session rather than for each run
+
+    conf = ss_timing.conf.get_conf(subj_id=subj_id)
+
+    if end_run is None:
+        end_run = conf.n_runs
+
+    data = _get_bin_data(conf)
+
+    tables = ss_timing.psi.get_tables(conf)
+
+    close_display = display is None
+
+    if display is None:
+        display = ss_timing.display.Display(conf)
+        display.open()
+
+    try:
+
+        for run_num in xrange(start_run, end_run + 1):
+
+            attempts = 0
+
+            while True:
+
+                try:
+
+                    _run_run(
+                        conf,
+                        data,
+                        run_num,
+                        wait_at_end=run_num != conf.n_runs,
+                        show_finish=run_num == conf.n_runs,
+                        screenshots=screenshots,
+                        # later attempts carry on from where the previous one
+                        # stopped, as can the first run of the session
+                        resume=(
+                            attempts > 0 or
+                            (resume and run_num == start_run)
+                        ),
+                        display=display,
+                        tables=tables
+                    )
+
+                except MonitorError as e:
+
+                    print e.value
+
+                    attempts += 1
+
+                    if attempts == max_attempts:
+                        raise MonitorError("Maximum tries exceeded")
+
+                    # try again with a new window
+                    display.close()
+                    display.open()
+
+                else:
+                    break
+
+    finally:
+
+        if close_display:
+            display.close()
+
+
+def _get_bin_data(conf):
+
+    (_, bin_data_exists) = ss_timing.data.get_bin_data_path(conf)
+
+    # the binary table is the working copy; create it if need be
+    if not bin_data_exists:
+
+        (_, data_exists) = ss_timing.data.get_data_path(conf)
+
+        # if the path doesn't exist, then generate a new table
+        if not data_exists:
+            data = ss_timing.data.gen_data_table(conf)
+        else:
+            data = ss_timing.data.load_data(conf)
+
+        ss_timing.data.save_bin_data(conf, data)
+
+    data = ss_timing.data.load_bin_data(conf, writable=True)
+
+    return data
+
+
+def _run_run(
+    conf,
+    data,
+    run_num,
+    wait_to_start=True,
+    wait_at_end=True,
+    show_finish=False,
+    screenshots=False,
+    resume=False,
+    display=None,
+    tables=None
+):
 
     # pull out the trials for this run
-    i_this_run = (data["run_number"] == run_num)
+    i_this_run = np.flatnonzero(data["run_number"] == run_num)
     run_data = data[i_this_run]
 
+    (journal_path, journal_exists) = ss_timing.data.get_journal_path(
+        conf,
+        run_num
+    )
+
+    posteriors = None
+
+    # pick up from the last completed trial of an interrupted run
+    if resume and journal_exists:
+
+        (run_data, posteriors) = ss_timing.data.load_journal(conf, run_num)
+
+        data[i_this_run] = run_data
+        data.flush()
+
+        print (
+            "Resuming run " + str(run_num) + " after trial " +
+            str(np.sum(run_data["completed"]))
+        )
+
     # check that we haven't already done this run
-    try:
-        assert np.all(run_data["completed"] == 0)
-    except:
-        AssertionError("Trials for this run are already marked as completed")
+    if posteriors is None and np.any(run_data["completed"] == 1):
+        raise ValueError(
+            "Trials for this run are already marked as completed"
+        )
+
+    (_, snapshots_exist) = ss_timing.data.get_posteriors_path(conf, run_num)
+
+    # keep any posterior snapshots from before the run was interrupted
+    if posteriors is not None and snapshots_exist:
+        snapshots = ss_timing.data.load_posteriors(
+            conf,
+            run_num,
+            unpack=False
+        )
+    else:
+        snapshots = {}
+
+    # each trial is journalled, along with the staircase posteriors, and
+    # written to the binary table as soon as it is completed
+    def save_trial(i_run_trial, trial_data, posteriors):
+
+        ss_timing.data.save_journal(conf, run_num, run_data, posteriors)
+
+        stair_num = trial_data["stair_num"]
+        stair_trial = trial_data["stair_trial"]
+
+        # compact snapshots of the posterior are kept for later analysis
+        if stair_trial % conf.post_snapshot_interval == 0:
+
+            snapshots[(stair_num, stair_trial)] = (
+                ss_timing.data.pack_posterior(
+                    posteriors[stair_num - 1],
+                    tail=conf.post_snapshot_tail
+                )
+            )
+
+            ss_timing.data.save_posteriors(conf, run_num, snapshots)
+
+        ss_timing.data.save_trial(
+            data,
+            i_this_run[i_run_trial],
+            trial_data
+        )
 
     # perform the run
     run_data = _run(
         conf,
         run_data,
+        display=display,
+        tables=tables,
         wait_to_start=wait_to_start,
         wait_at_end=wait_at_end,
         show_finish=show_finish,
-        screenshots=screenshots
+        screenshots=screenshots,
+        save_trial=save_trial,
+        posteriors=posteriors,
+        frames_path=ss_timing.data.get_frames_path(conf, run_num)[0]
     )
 
     # check that all the trials have indeed been completed
@@ -77,103 +401,79 @@ def run(
     # check again that all is well
     assert np.all(data["completed"][i_this_run] == 1)
 
-    # and save
+    # and save, both in binary and as the text export
+    data.flush()
     ss_timing.data.save_data(conf, data)
 
+    # the journal is only needed for an incomplete run
+    os.remove(journal_path)
+
 
 def _run(
     conf,
     run_data,
-    win=None,
-    close_win=True,
+    display=None,
+    tables=None,
     wait_to_start=True,
     wait_at_end=True,
     show_finish=False,
-    screenshots=False
+    screenshots=False,
+    save_trial=None,
+    posteriors=None,
+    frames_path=None
 ):
 
-    trial_timer = psychopy.core.Clock()
+    import psychopy.core
 
-    # initialise the staircases
-    psis = [
-        stimuli.psi.Psi(
-            alpha_levels=conf.alpha_levels,
-            beta_levels=conf.beta_levels,
-            stim_levels=conf.x_levels,
-            psych_func=conf.psych_func
-        )
-        for _ in xrange(conf.n_stairs_per_run)
-    ]
+    psis = _get_psis(conf, posteriors=posteriors, tables=tables)
 
-    _ = [psi.step() for psi in psis]
+    # only close the display if it was opened for this run
+    close_display = display is None
 
-    if win is None:
-        win = psychopy.visual.Window(
-            size=conf.monitor_res_pix,
-            monitor=conf.monitor_name,
-            fullscr=True,
-            allowGUI=False,
-            autoLog=False,
-            units="deg",
-            gamma=1.0,
-            useFBO=True,
-            waitBlanking=False  # HACK
-        )
-
-        bits = psychopy.hardware.crs.BitsSharp(
-            win=win,
-            mode=conf.monitor_mode,
-            gamma="hardware",
-            portName=conf.monitor_port
-        )
-        bits.temporalDithering = False
+    if display is None:
+        display = ss_timing.display.Display(conf)
+        display.open()
 
-        pyglet.gl.glColorMask(1, 1, 0, 1)
+    try:
 
-        max_attempts = 3
-        for _ in xrange(max_attempts):
+        try:
+            refresh = display.check_refresh()
 
-            # check the refresh
-            ms_avg = win.getMsPerFrame(nFrames=120)[0]
+        except MonitorError:
 
-            try:
+            print (
+                "This is run number " +
+                str(run_data["run_number"][0])
+            )
 
-                np.testing.assert_almost_equal(
-                    ms_avg,
-                    1.0 / 120 * 1000,
-                    decimal=1
-                )
+            raise
 
-            except AssertionError:
+        # keep the measurement that the run was validated against; trials
+        # completed before a resume keep the measurement that they were run
+        # with
+        i_pending = (run_data["completed"] == 0)
 
-                pass
+        run_data["refresh_ms"][i_pending] = refresh["ms_mean"]
+        run_data["refresh_sd_ms"][i_pending] = refresh["ms_sd"]
+        run_data["refresh_n_frames"][i_pending] = refresh["n_frames"]
+        run_data["refresh_n_outliers"][i_pending] = refresh["n_outliers"]
 
-            else:
-                break
+        win = display.win
 
-        else:
+        stim = display.get_stim()
 
-            bits.mode = "auto++"
-            bits.com.close()
-            win.close()
+        if screenshots:
 
-            print (
-                "This is run number " +
-                str(run_data["run_number"][0])
+            screenshot_writer = _ScreenshotWriter(
+                frame_size=win.size,
+                img_format=conf.screenshot_format,
+                max_queued=conf.screenshot_queue_size
             )
 
-            raise MonitorError(
-                "Monitor refresh was detected as {n:.03f}".format(
-                    n=ms_avg
-                )
-            )
+            screenshot_writer.start()
 
-    try:
-
-        stim = ss_timing.stim.get_stim(
-            conf=conf,
-            win=win
-        )
+        else:
+            screenshot_writer = None
 
         if wait_to_start:
 
@@ -195,44 +495,65 @@ def _run(
 
         psychopy.core.wait(0.5)
 
-        for trial_data in run_data:
+        frame_schedules = {}
+
+        def prepare_trial(trial_data):
+
+            frame_schedules[trial_data["run_trial"]] = get_frame_schedule(
+                conf,
+                trial_data
+            )
+
+        def run_trial(trial_data, resp_callback):
 
             if screenshots:
                 screenshot_base = "cap_t_{n:d}".format(n=trial_data["run_trial"])
             else:
                 screenshot_base = None
 
-            assert trial_data["completed"] == 0
-
-            i_stair = trial_data["stair_num"] - 1
-
-            target_contrast = psis[i_stair].get_curr_stim_level()
-
-            trial_data["target_contrast"] = target_contrast
-
-            trial_timer.reset()
+            frame_intervals = np.zeros(conf.vis_train_frames + 1)
 
             trial_data = _run_trial(
                 conf,
                 win,
                 stim,
                 trial_data,
-                screenshot_base
+                screenshot_base,
+                screenshot_writer=screenshot_writer,
+                resp_callback=resp_callback,
+                frame_intervals=frame_intervals,
+                frame_schedule=frame_schedules.pop(trial_data["run_trial"])
             )
 
-            # update
-            psis[i_stair].update(trial_data["correct"])
-            psis[i_stair].step()
+            if frames_path is not None:
+                ss_timing.data.append_frame_intervals(
+                    frames_path,
+                    trial_data["run_trial"],
+                    frame_intervals
+                )
 
-            (psi_a, psi_b) = psis[i_stair].get_estimates()
+            return trial_data
 
-            trial_data["alpha_hat"] = psi_a
-            trial_data["beta_hat"] = psi_b
-            trial_data["completed"] = 1
-            trial_data["when"] = str(datetime.datetime.now())
+        run_data = _run_trials(
+            conf,
+            run_data,
+            psis,
+            run_trial,
+            save_trial=save_trial,
+            prepare_trial=prepare_trial
+        )
 
-            while trial_timer.getTime() < conf.min_iti:
-                pass
+        frame_summary = ss_timing.data.get_frame_summary(run_data)
+
+        print (
+            "Max frame jitter: {j:.2f} ms; dropped frames: {d:d}; " +
+            "SOA range: {s_min:.2f} to {s_max:.2f} ms"
+        ).format(
+            j=frame_summary["max_jitter"] * 1000.0,
+            d=frame_summary["n_dropped"],
+            s_min=frame_summary["min_soa"] * 1000.0,
+            s_max=frame_summary["max_soa"] * 1000.0
+        )
 
         if wait_at_end:
 
@@ -258,43 +579,306 @@ def _run(
 
             conf.exp_input.wait()
 
+        if screenshot_writer is not None:
+            screenshot_writer.close()
+
     except:
 
         raise
 
     finally:
 
-        if close_win:
-            bits.mode = "auto++"
-            bits.com.close()
-            win.close()
+        if close_display:
+            display.close()
+
+    return run_data
+
+
+def _get_psis(conf, posteriors=None, tables=None):
+
+    # the likelihood tables are cached on disk and shared by the staircases
+    if tables is None:
+        tables = ss_timing.psi.get_tables(conf)
+
+    (p_corr, h_corr) = tables
+
+    # initialise the staircases
+    psis = [
+        ss_timing.psi.Psi(
+            alpha_levels=conf.alpha_levels,
+            beta_levels=conf.beta_levels,
+            stim_levels=conf.x_levels,
+            p_corr=p_corr,
+            h_corr=h_corr,
+            prune_tail=conf.psi_prune_tail,
+            prune_after=conf.psi_prune_after,
+            dtype=conf.psi_dtype,
+            log_domain=conf.psi_log_domain
+        )
+        for _ in xrange(conf.n_stairs_per_run)
+    ]
+
+    # restore the staircases from an interrupted run
+    if posteriors is not None:
+        for (psi, posterior) in zip(psis, posteriors):
+            psi.set_posterior(posterior)
+
+    _ = [psi.step() for psi in psis]
+
+    return psis
+
+
+def _run_trials(
+    conf,
+    run_data,
+    psis,
+    run_trial,
+    save_trial=None,
+    wait_iti=True,
+    prepare_trial=None,
+    psi_threaded=None
+):
+
+    # `run_trial` is called as `run_trial(trial_data, resp_callback)` and
+    # needs to return the trial data with the response filled in; if given,
+    # `prepare_trial` is called as `prepare_trial(trial_data)` once the
+    # target contrast for a trial is known, during the previous ITI
+
+    if psi_threaded is None:
+        psi_threaded = conf.psi_threaded
+
+    def prepare(trial_data):
+
+        i_stair = trial_data["stair_num"] - 1
+
+        trial_data["target_contrast"] = psis[i_stair].get_curr_stim_level()
+
+        if prepare_trial is not None:
+            prepare_trial(trial_data)
+
+    # skip those already done before the run was interrupted
+    i_run_trials = np.flatnonzero(run_data["completed"] != 1)
+
+    if len(i_run_trials) > 0:
+        prepare(run_data[i_run_trials[0]])
+
+    trial_timer = _Clock()
+
+    for (i_trial, i_run_trial) in enumerate(i_run_trials):
+
+        trial_data = run_data[i_run_trial]
+
+        i_stair = trial_data["stair_num"] - 1
+
+        if i_trial > 0:
+            trial_data["iti"] = trial_timer.getTime()
+
+        trial_timer.reset()
+
+        psi_updates = []
+
+        if psi_threaded:
+
+            # start updating the staircase as soon as the response is
+            # known, so that it overlaps with the feedback
+            def resp_callback(resp_data):
+
+                psi_update = _PsiUpdate(
+                    psis[i_stair],
+                    resp_data["correct"]
+                )
+                psi_update.start()
+
+                psi_updates.append(psi_update)
+
+        else:
+
+            resp_callback = None
+
+        trial_data = run_trial(trial_data, resp_callback)
+
+        psi_start = trial_timer.getTime()
+
+        # update
+        if psi_threaded:
+            psi_update = psi_updates.pop()
+            psi_update.join()
+        else:
+            psi_update = _PsiUpdate(psis[i_stair], trial_data["correct"])
+            psi_update.run()
+
+        if psi_update.error is not None:
+            raise psi_update.error
+
+        trial_data["psi_time"] = psi_update.duration
+
+        psi_end = trial_timer.getTime()
+
+        # report if the staircase was the reason the ITI was overrun; if the
+        # trial itself ran past the ITI, then the staircase isn't to blame
+        psi_overrun = psi_end - conf.min_iti
+
+        if wait_iti and psi_start < conf.min_iti and psi_overrun > 0:
+            print (
+                "Staircase update overran the ITI by " +
+                "{t:.1f} ms".format(t=psi_overrun * 1000.0)
+            )
+
+        (psi_a, psi_b) = psis[i_stair].get_estimates()
+
+        trial_data["alpha_hat"] = psi_a
+        trial_data["beta_hat"] = psi_b
+        trial_data["completed"] = 1
+        trial_data["when"] = str(datetime.datetime.now())
+
+        # the rest of the ITI is used to save this trial and to get the next
+        # one ready
+        if save_trial is not None:
+            save_trial(
+                i_run_trial,
+                trial_data,
+                [psi.get_posterior() for psi in psis]
+            )
+
+        if i_trial + 1 < len(i_run_trials):
+            prepare(run_data[i_run_trials[i_trial + 1]])
+
+        if wait_iti:
+            _wait_until(trial_timer, conf.min_iti, spin_s=conf.iti_spin_s)
 
     return run_data
 
 
+def _wait_until(timer, end_s, spin_s):
+
+    # sleeping for most of the wait doesn't hold up the other threads, and
+    # spinning at the end means the wait finishes on time
+    remaining_s = end_s - timer.getTime()
+
+    while remaining_s > spin_s:
+
+        time.sleep(remaining_s - spin_s)
+
+        remaining_s = end_s - timer.getTime()
+
+    while timer.getTime() < end_s:
+        pass
+
+
+def get_frame_schedule(conf, trial_data):
+
+    surr_contrasts = (
+        trial_data["surr_contrast"] *
+        conf.vis_train["surr"][trial_data["surr_onset"]]
+    )
+
+    target_contrasts = (
+        trial_data["target_contrast"] *
+        conf.vis_train["target"]
+    )
+
+    # the fixation is bright while the target is being shown; it is only set
+    # on those frames where it changes (it is dark going into the train)
+    fix_on = [1] * 3
+    fix_off = [-1] * 3
+
+    fix_cols = []
+    prev_fix_col = fix_off
+
+    for target_shown in conf.vis_train["target"]:
+
+        if target_shown == 1:
+            fix_col = fix_on
+        else:
+            fix_col = fix_off
+
+        if fix_col is prev_fix_col:
+            fix_cols.append(None)
+        else:
+            fix_cols.append(fix_col)
+
+        prev_fix_col = fix_col
+
+    # as plain python values, so there is no numpy indexing in the frame loop
+    frame_schedule = zip(
+        surr_contrasts.tolist(),
+        target_contrasts.tolist(),
+        fix_cols
+    )
+
+    return frame_schedule
+
+
+def _set_frame_timing(conf, trial_data, flip_times):
+
+    # make the flip times relative to the first frame of the stimulus train
+    train_times = flip_times[1:] - flip_times[1]
+
+    frame_intervals = np.diff(flip_times)
+
+    trial_data["max_frame_jitter"] = np.max(
+        np.abs(frame_intervals - 1.0 / conf.refresh_hz)
+    )
+
+    surr_frames = np.flatnonzero(
+        conf.vis_train["surr"][trial_data["surr_onset"]]
+    )
+    target_frames = np.flatnonzero(conf.vis_train["target"])
+
+    # the offset is the flip after the last frame the target was shown on,
+    # which can be the flip to the response screen
+    trial_data["surr_onset_time"] = train_times[surr_frames[0]]
+    trial_data["target_onset_time"] = train_times[target_frames[0]]
+    trial_data["target_offset_time"] = train_times[target_frames[-1] + 1]
+
+
 def _run_trial(
     conf,
     win,
     stim,
     trial_data,
-    screenshot_base=None
+    screenshot_base=None,
+    screenshot_writer=None,
+    resp_callback=None,
+    frame_intervals=None,
+    frame_schedule=None
 ):
 
+    import psychopy.core
+
     if screenshot_base is not None:
+
         cap_count = 1
 
+        if screenshot_writer is None:
+            trial_writer = _ScreenshotWriter(
+                frame_size=win.size,
+                img_format=conf.screenshot_format
+            )
+            trial_writer.start()
+        else:
+            trial_writer = screenshot_writer
+
+    # time of each flip in the stimulus train, plus the flip before it and
+    # the flip after it, relative to the start of the train
+    flip_times = np.zeros(conf.vis_train_frames + 2)
+
     timer = psychopy.core.Clock()
     conf.exp_input.set_clock(timer)
 
-    grating_phase = np.random.rand()
+    # work out everything that changes over the frames of the stimulus train
+    # before any of them are shown
+    if frame_schedule is None:
+        frame_schedule = get_frame_schedule(conf, trial_data)
 
-    stim["surr"].phase = grating_phase
-    stim["surr"].ori = stimuli.utils.math_to_nav_polar(trial_data["surr_ori"])
+    # the surround and targets are already set up for each phase and
+    # orientation
+    (surr, targets) = stim["gratings"].get(
+        surr_ori=trial_data["surr_ori"],
+        i_phase=np.random.randint(conf.n_grating_phases)
+    )
 
-    for target in stim["targets"].values():
-        # not entirely sure why, but 0.5 needs to be added to the target phase
-        # so that it stays aligned with the surround
-        target.phase = grating_phase + 0.5
+    for target in targets.values():
         target.contrast = 0.0
 
     # ready to start the trial
@@ -306,51 +890,61 @@ def _run_trial(
         stim["fixation"].draw()
         win.flip()
 
+    flip_times[0] = timer.getTime()
+
     # stim
-    win.recordFrameIntervals = True
-    win.nDroppedFrames = 0
+    target = targets[trial_data["target_pos"]]
+    fixation = stim["fixation"]
 
-    for i_frame in xrange(conf.vis_train_frames):
+    # a zero-contrast grating is only a no-op when there is nothing under it;
+    # over the surround, the targets cut (mean luminance) holes into it and so
+    # they all need to be drawn while the surround is shown
+    surr_draws = [surr] + targets.values()
+    target_draws = [target]
 
-        # set the contrasts of the surround and target based on which frame it
-        # is
-        stim["surr"].contrast = (
-            trial_data["surr_contrast"] *
-            conf.vis_train["surr"][trial_data["surr_onset"]][i_frame]
-        )
+    frame_draws = []
 
-        stim["targets"][trial_data["target_pos"]].contrast = (
-            trial_data["target_contrast"] *
-            conf.vis_train["target"][i_frame]
-        )
+    for (surr_contrast, target_contrast, _) in frame_schedule:
 
-        # update the fixation colour if the target is being shown
-        if conf.vis_train["target"][i_frame] == 1:
-            stim["fixation"].set_fix_col([1] * 3)
+        if surr_contrast != 0:
+            frame_draws.append(surr_draws)
+        elif target_contrast != 0:
+            frame_draws.append(target_draws)
         else:
-            stim["fixation"].set_fix_col([-1] * 3)
+            frame_draws.append([])
 
-        stim["surr"].draw()
-        _ = [target.draw() for target in stim["targets"].values()]
-        stim["fixation"].draw()
+    win.recordFrameIntervals = True
+    win.nDroppedFrames = 0
 
-        win.flip()
+    for (i_frame, (surr_contrast, target_contrast, fix_col)) in enumerate(
+        frame_schedule
+    ):
 
-    if screenshot_base is not None:
+        surr.contrast = surr_contrast
+        target.contrast = target_contrast
 
-        img = win.getMovieFrame()
+        if fix_col is not None:
+            fixation.set_fix_col(fix_col)
 
-        scipy.misc.imsave(
-            screenshot_base + "_{n:d}.png".format(n=cap_count),
-            np.array(img)[..., -1].astype("uint8")
-        )
+        for frame_stim in frame_draws[i_frame]:
+            frame_stim.draw()
 
-        cap_count += 1
+        fixation.draw()
 
-    if win.nDroppedFrames > 0:
-        print "Frame dropped"
+        win.flip()
 
-    win.recordFrameIntervals = False
+        flip_times[i_frame + 1] = timer.getTime()
+
+        # every frame of the train is captured; only the read back of the
+        # frame is done here, and the rest is left to the writer
+        if screenshot_base is not None:
+
+            trial_writer.put(
+                screenshot_base + "_{n:d}".format(n=cap_count),
+                _read_frame(win, trial_writer.get_buffer())
+            )
+
+            cap_count += 1
 
     # response
     stim["fixation"].set_fix_col([-0.5] * 3)
@@ -358,6 +952,20 @@ def _run_trial(
     _ = [ring.draw() for ring in stim["rings"]]
     win.flip()
 
+    flip_times[-1] = timer.getTime()
+
+    win.recordFrameIntervals = False
+
+    if win.nDroppedFrames > 0:
+        print "Frame dropped"
+
+    trial_data["n_dropped_frames"] = win.nDroppedFrames
+
+    _set_frame_timing(conf, trial_data, flip_times)
+
+    if frame_intervals is not None:
+        frame_intervals[:] = np.diff(flip_times)
+
     conf.exp_input.clear()
     keys = conf.exp_input.wait(
         valid_keys=conf.resp_map.keys() + ["q"]
@@ -377,6 +985,9 @@ def _run_trial(
         trial_data["response_pos"] == trial_data["target_pos"]
     )
 
+    if resp_callback is not None:
+        resp_callback(trial_data)
+
     stim["fb"][trial_data["correct"]].pos = conf.fb_positions[
         trial_data["target_pos"]
     ]
@@ -388,18 +999,50 @@ def _run_trial(
 
     if screenshot_base is not None:
 
-        img = win.getMovieFrame()
-
-        scipy.misc.imsave(
-            screenshot_base + "_{n:d}.png".format(n=cap_count),
-            np.array(img)[..., -1].astype("uint8")
+        trial_writer.put(
+            screenshot_base + "_{n:d}".format(n=cap_count),
+            _read_frame(win, trial_writer.get_buffer())
         )
 
         cap_count += 1
 
+        if screenshot_writer is None:
+            trial_writer.close()
+
     psychopy.core.wait(conf.fb_s)
 
     stim["fixation"].draw()
     win.flip()
 
     return trial_data
+
+
+def _read_frame(win, frame):
+
+    import ctypes
+    import pyglet.gl as gl
+
+    # only the blue channel of the frame that has just been shown is read, and
+    # into a buffer that already exists, rather than via `getMovieFrame`
+    (height, width) = frame.shape
+
+    if win.useFBO:
+        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, 0)
+
+    gl.glReadBuffer(gl.GL_FRONT)
+    gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+
+    gl.glReadPixels(
+        0,
+        0,
+        width,
+        height,
+        gl.GL_BLUE,
+        gl.GL_UNSIGNED_BYTE,
+        frame.ctypes.data_as(ctypes.c_void_p)
+    )
+
+    if win.useFBO:
+        gl.glBindFramebufferEXT(gl.GL_FRAMEBUFFER_EXT, win.frameBuffer)
+
+    return frame
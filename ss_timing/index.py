@@ -0,0 +1,242 @@
+import glob
+import os
+
+import numpy as np
+
+import ss_timing.data
+
+
+def update_index(conf, path=None):
+
+    if path is None:
+        (path, path_exists) = get_index_path(conf)
+    else:
+        path_exists = os.path.exists(path)
+
+    if path_exists:
+        old_index = load_index(conf, path)
+    else:
+        old_index = np.zeros(0, dtype=get_index_dtype())
+
+    # other files (e.g. the frame timing) can also be in the data directory,
+    # so only those with a data table header are indexed
+    data_files = sorted(
+        data_file
+        for data_file in glob.glob(
+            os.path.join(conf.data_path, conf.study_id + "_*.txt")
+        )
+        if ss_timing.data.is_data_file(data_file)
+    )
+
+    index = []
+
+    for data_file in data_files:
+
+        filename = os.path.basename(data_file)
+
+        file_stat = os.stat(data_file)
+
+        file_index = old_index[old_index["filename"] == filename]
+
+        # only reparse those files that have changed since the last update
+        if (
+            len(file_index) == 0 or
+            file_index["mtime"][0] != file_stat.st_mtime or
+            file_index["size"][0] != file_stat.st_size
+        ):
+            file_index = _index_file(conf, data_file, file_stat)
+
+        index.append(file_index)
+
+    if index:
+        index = np.concatenate(index)
+    else:
+        index = np.zeros(0, dtype=get_index_dtype())
+
+    ss_timing.data.write_atomic(
+        path,
+        lambda index_file: np.save(index_file, index)
+    )
+
+    return index
+
+
+def load_index(conf, path=None):
+
+    if path is None:
+        (path, path_exists) = get_index_path(conf)
+    else:
+        path_exists = os.path.exists(path)
+
+    if not path_exists:
+        raise OSError("Path " + path + " does not exist")
+
+    index = np.load(path)
+
+    return index
+
+
+def query(
+    conf,
+    surr_onset=None,
+    surr_ori=None,
+    completed=None,
+    subj_ids=None,
+    columns=None,
+    index=None
+):
+
+    if index is None:
+        index = update_index(conf)
+
+    (_, dt, _) = ss_timing.data.get_data_dtype()
+
+    if columns is None:
+        columns = list(dt.names)
+
+    # choose the runs from the index before touching any of the data files
+    i_runs = np.ones(len(index), dtype=np.bool)
+
+    if surr_onset is not None:
+        i_runs &= (index["surr_onset"] == surr_onset)
+
+    if surr_ori is not None:
+        i_runs &= (index["surr_ori"] == surr_ori)
+
+    if subj_ids is not None:
+        i_runs &= np.in1d(index["subj_id"], subj_ids)
+
+    if completed:
+        i_runs &= (index["n_completed"] > 0)
+    elif completed is not None:
+        i_runs &= (index["n_completed"] < index["n_trials"])
+
+    run_index = index[i_runs]
+
+    out_dt = np.dtype(
+        [("subj_id", get_index_dtype()["subj_id"])] +
+        [(column, dt[column]) for column in columns]
+    )
+
+    out_data = []
+
+    for filename in np.unique(run_index["filename"]):
+
+        file_runs = run_index[run_index["filename"] == filename]
+
+        file_data = ss_timing.data.load_data(
+            conf,
+            path=os.path.join(conf.data_path, filename),
+            columns=sorted(set(columns) | set(["completed"]))
+        )
+
+        for file_run in file_runs:
+
+            run_data = file_data[file_run["row_start"]:file_run["row_stop"]]
+
+            if completed is not None:
+                run_data = run_data[run_data["completed"] == int(completed)]
+
+            run_out = np.zeros(len(run_data), dtype=out_dt)
+
+            run_out["subj_id"] = file_run["subj_id"]
+
+            for column in columns:
+                run_out[column] = run_data[column]
+
+            out_data.append(run_out)
+
+    if out_data:
+        out_data = np.concatenate(out_data)
+    else:
+        out_data = np.zeros(0, dtype=out_dt)
+
+    return out_data
+
+
+def get_index_dtype():
+
+    (_, data_dt, _) = ss_timing.data.get_data_dtype()
+
+    index_dt = np.dtype(
+        [
+            ("subj_id", (np.str_, 64)),
+            ("filename", (np.str_, 128)),
+            ("mtime", np.float),
+            ("size", np.uint64),
+            ("run_number", data_dt["run_number"]),
+            ("surr_onset", data_dt["surr_onset"]),
+            ("i_surr_onset", data_dt["i_surr_onset"]),
+            ("surr_ori", data_dt["surr_ori"]),
+            ("i_surr_ori", data_dt["i_surr_ori"]),
+            ("n_trials", np.uint16),
+            ("n_completed", np.uint16),
+            ("row_start", np.uint32),
+            ("row_stop", np.uint32)
+        ]
+    )
+
+    return index_dt
+
+
+def get_index_path(conf):
+
+    index_path = os.path.join(
+        conf.data_path,
+        "{s:s}_index.npy".format(s=conf.study_id)
+    )
+
+    index_path_exists = os.path.exists(index_path)
+
+    return (index_path, index_path_exists)
+
+
+def _index_file(conf, data_file, file_stat):
+
+    filename = os.path.basename(data_file)
+
+    # files are named as "study_subj.txt"
+    subj_id = os.path.splitext(filename)[0][len(conf.study_id) + 1:]
+
+    data = ss_timing.data.load_data(
+        conf,
+        path=data_file,
+        columns=[
+            "run_number",
+            "surr_onset",
+            "i_surr_onset",
+            "surr_ori",
+            "i_surr_ori",
+            "completed"
+        ]
+    )
+
+    run_numbers = np.unique(data["run_number"])
+
+    file_index = np.zeros(len(run_numbers), dtype=get_index_dtype())
+
+    file_index["subj_id"] = subj_id
+    file_index["filename"] = filename
+    file_index["mtime"] = file_stat.st_mtime
+    file_index["size"] = file_stat.st_size
+
+    for (run_index, run_number) in zip(file_index, run_numbers):
+
+        i_run = np.flatnonzero(data["run_number"] == run_number)
+
+        # the trials for a run are stored contiguously
+        assert np.all(np.diff(i_run) == 1)
+
+        run_data = data[i_run]
+
+        run_index["run_number"] = run_number
+
+        for column in ("surr_onset", "i_surr_onset", "surr_ori", "i_surr_ori"):
+            run_index[column] = run_data[column][0]
+
+        run_index["n_trials"] = len(run_data)
+        run_index["n_completed"] = np.sum(run_data["completed"])
+        run_index["row_start"] = i_run[0]
+        run_index["row_stop"] = i_run[-1] + 1
+
+    return file_index
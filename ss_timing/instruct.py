@@ -2,20 +2,17 @@ import os
 
 import numpy as np
 
-import pyglet
-import psychopy.logging
-psychopy.logging.console.setLevel(psychopy.logging.CRITICAL)
-
-import psychopy.visual
-
-import stimuli.psychopy_ext
-
 import ss_timing.conf
+import ss_timing.display
 import ss_timing.exp
 import ss_timing.data
 
 
-def run(bits_mode=True):
+def run(bits_mode=True, display=None):
+
+    import psychopy.visual
+    import stimuli.psychopy_ext
+    import stimuli.utils
 
     conf = ss_timing.conf.get_conf("instruct")
 
@@ -33,35 +30,20 @@ def run(bits_mode=True):
 
     trial_info = np.zeros(1, dtype=trial_dt)[0]
 
-    win = psychopy.visual.Window(
-        size=conf.monitor_res_pix,
-        monitor=conf.monitor_name,
-        fullscr=True,
-        allowGUI=False,
-        autoLog=False,
-        units="deg",
-        gamma=1.0,
-        useFBO=True,
-        waitBlanking=False  # HACK
-    )
-
-    if bits_mode:
-
-        bits = psychopy.hardware.crs.BitsSharp(
-            win=win,
-            mode=conf.monitor_mode,
-            gamma="hardware",
-            portName=conf.monitor_port
-        )
-        bits.temporalDithering = False
+    # only close the display if it was opened here
+    close_display = display is None
+
+    if display is None:
+        display = ss_timing.display.Display(conf, bits_mode=bits_mode)
+        display.open()
 
-        pyglet.gl.glColorMask(1, 1, 0, 1)
+    win = display.win
 
     try:
 
         win.flip()
 
-        stim = ss_timing.stim.get_stim(conf, win)
+        stim = display.get_stim()
 
         # 01-0
         target = psychopy.visual.GratingStim(
@@ -154,13 +136,11 @@ def run(bits_mode=True):
 
     finally:
 
-        if bits_mode:
-            bits.mode = "auto++"
-            bits.com.close()
-        win.close()
+        if close_display:
+            display.close()
 
 
-def run_b(bits_mode=True):
+def run_b(bits_mode=True, display=None):
 
     conf = ss_timing.conf.get_conf("instruct")
 
@@ -177,35 +157,20 @@ def run_b(bits_mode=True):
 
     trial_info = np.zeros(1, dtype=trial_dt)[0]
 
-    win = psychopy.visual.Window(
-        size=conf.monitor_res_pix,
-        monitor=conf.monitor_name,
-        fullscr=True,
-        allowGUI=False,
-        autoLog=False,
-        units="deg",
-        gamma=1.0,
-        useFBO=True,
-        waitBlanking=False  # HACK
-    )
-
-    if bits_mode:
-
-        bits = psychopy.hardware.crs.BitsSharp(
-            win=win,
-            mode=conf.monitor_mode,
-            gamma="hardware",
-            portName=conf.monitor_port
-        )
-        bits.temporalDithering = False
+    # only close the display if it was opened here
+    close_display = display is None
+
+    if display is None:
+        display = ss_timing.display.Display(conf, bits_mode=bits_mode)
+        display.open()
 
-        pyglet.gl.glColorMask(1, 1, 0, 1)
+    win = display.win
 
     try:
 
         win.flip()
 
-        stim = ss_timing.stim.get_stim(conf, win)
+        stim = display.get_stim()
 
         # 01-0
         stim["surr"].ori = 0.0
@@ -288,10 +253,8 @@ def run_b(bits_mode=True):
 
     finally:
 
-        if bits_mode:
-            bits.mode = "auto++"
-            bits.com.close()
-        win.close()
+        if close_display:
+            display.close()
 
 def _draw_and_wait(conf, stim_to_draw, win):
 
@@ -3,15 +3,12 @@ import tempfile
 
 import numpy as np
 
-import matplotlib.pyplot as plt
-plt.ioff()
-
 import ss_timing.conf
 import ss_timing.data
 import ss_timing.exp
 
 
-def run():
+def run(display=None, show_plot=True):
 
     conf = ss_timing.conf.get_conf("practice")
 
@@ -27,6 +24,7 @@ def run():
     run_data = ss_timing.exp._run(
         conf,
         run_data,
+        display=display,
         wait_to_start=True,
         wait_at_end=False,
         show_finish=False
@@ -42,7 +40,10 @@ def run():
 
     print "Saved practice data to " + temp.name
 
-    plot(conf, run_data)
+    # the plot can't be seen behind a window that is still open, so it can be
+    # left until later with `plot_from_file`
+    if show_plot:
+        plot(conf, run_data)
 
     return run_data
 
@@ -58,6 +59,10 @@ def plot_from_file(path):
 
 def plot(conf, data):
 
+    # only needed for the plot, so not imported with the module
+    import matplotlib.pyplot as plt
+    plt.ioff()
+
     fig = plt.figure()
 
     fine_x = np.logspace(np.log10(0.001), np.log10(0.5), 100)
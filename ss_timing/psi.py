@@ -0,0 +1,357 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+class Psi(object):
+
+    def __init__(
+        self,
+        alpha_levels,
+        beta_levels,
+        stim_levels,
+        psych_func=None,
+        p_corr=None,
+        h_corr=None,
+        prune_tail=None,
+        prune_after=0,
+        dtype=np.float64,
+        log_domain=False
+    ):
+
+        self._alpha_levels = np.asarray(alpha_levels)
+        self._beta_levels = np.asarray(beta_levels)
+        self._stim_levels = np.asarray(stim_levels)
+
+        # p(correct | alpha, beta, x) and the binary entropy of each of its
+        # entries; both can be shared across staircases
+        if p_corr is None or h_corr is None:
+            (p_corr, h_corr) = calc_tables(
+                alpha_levels=self._alpha_levels,
+                beta_levels=self._beta_levels,
+                stim_levels=self._stim_levels,
+                psych_func=psych_func,
+                dtype=dtype
+            )
+
+        self._p_corr = p_corr
+        self._h_corr = h_corr
+
+        # if `prune_tail` is not None, then after `prune_after` trials the
+        # parameter grid is progressively restricted to the region that
+        # excludes `prune_tail` of the posterior mass at either end of the
+        # alpha and beta marginals
+        self._prune_tail = prune_tail
+        self._prune_after = prune_after
+
+        self._n_updates = 0
+
+        # the posterior can be held in single precision and/or accumulated
+        # as log probabilities, which avoids the repeated multiplications
+        # running into the limits of the precision
+        self._dtype = dtype
+        self._log_domain = log_domain
+
+        # uniform prior
+        self._p_ab = np.ones(
+            (len(self._alpha_levels), len(self._beta_levels)),
+            dtype=self._dtype
+        )
+
+        if self._log_domain:
+            self._log_p_ab = np.log(self._p_ab)
+
+        self._normalise()
+
+        self._set_bounds(
+            (0, len(self._alpha_levels), 0, len(self._beta_levels))
+        )
+
+        self._i_stim_level = None
+
+    def step(self):
+
+        # the expected entropy of the posterior after a trial at x is
+        #   H(p_ab) - (h(p_c(x)) - sum_ab p_ab * h(p(c | a, b, x)))
+        # where h is the binary entropy, so the search over all the
+        # stimulus levels reduces to two contractions over the posterior
+        p_ab = self._p_ab[self._i_ab]
+
+        p_c = np.tensordot(p_ab, self._p_corr_active, axes=2)
+        e_h_corr = np.tensordot(p_ab, self._h_corr_active, axes=2)
+
+        info_gain = _binary_entropy(p_c) - e_h_corr
+
+        self._i_stim_level = np.argmax(info_gain)
+
+    def update(self, resp):
+
+        p_r = self._p_corr_active[..., self._i_stim_level]
+
+        if not resp:
+            p_r = 1.0 - p_r
+
+        if self._log_domain:
+            self._log_p_ab[self._i_ab] += np.log(p_r)
+        else:
+            self._p_ab[self._i_ab] *= p_r
+
+        self._normalise()
+
+        self._n_updates += 1
+
+        if (
+            self._prune_tail is not None and
+            self._n_updates >= self._prune_after
+        ):
+            self._prune()
+
+    def get_posterior(self):
+
+        return self._p_ab.astype(np.float64)
+
+    def set_posterior(self, p_ab):
+
+        self._p_ab = np.array(p_ab, dtype=self._dtype)
+
+        if self._log_domain:
+            with np.errstate(divide="ignore"):
+                self._log_p_ab = np.log(self._p_ab)
+
+        self._normalise()
+
+        # a posterior from a pruned staircase is zero outside its region
+        (i_alpha, i_beta) = np.nonzero(self._p_ab)
+
+        self._set_bounds(
+            (
+                np.min(i_alpha),
+                np.max(i_alpha) + 1,
+                np.min(i_beta),
+                np.max(i_beta) + 1
+            )
+        )
+
+    def get_bounds(self):
+
+        return self._bounds
+
+    def get_curr_stim_level(self):
+
+        return self._stim_levels[self._i_stim_level]
+
+    def get_estimates(self):
+
+        p_ab = self._p_ab.astype(np.float64)
+
+        alpha_hat = np.sum(np.sum(p_ab, axis=1) * self._alpha_levels)
+        beta_hat = np.sum(np.sum(p_ab, axis=0) * self._beta_levels)
+
+        return (alpha_hat, beta_hat)
+
+    def _prune(self):
+
+        new_bounds = get_mass_bounds(self._p_ab, self._prune_tail)
+
+        # the region can only ever shrink
+        new_bounds = (
+            max(new_bounds[0], self._bounds[0]),
+            min(new_bounds[1], self._bounds[1]),
+            max(new_bounds[2], self._bounds[2]),
+            min(new_bounds[3], self._bounds[3])
+        )
+
+        # restricting the tables involves copying them, so only bother once
+        # the region has shrunk by a reasonable amount
+        if _bounds_size(new_bounds) < 0.75 * _bounds_size(self._bounds):
+            self._set_bounds(new_bounds)
+
+    def _set_bounds(self, bounds):
+
+        self._bounds = tuple(int(bound) for bound in bounds)
+
+        (a_lower, a_upper, b_lower, b_upper) = self._bounds
+
+        self._i_ab = (slice(a_lower, a_upper), slice(b_lower, b_upper))
+
+        # the posterior outside of the region is discarded
+        in_bounds = np.zeros(self._p_ab.shape, dtype=np.bool)
+        in_bounds[self._i_ab] = True
+
+        if self._log_domain:
+            self._log_p_ab[~in_bounds] = -np.inf
+        else:
+            self._p_ab[~in_bounds] = 0.0
+
+        self._normalise()
+
+        full_bounds = (0, len(self._alpha_levels), 0, len(self._beta_levels))
+
+        # the full tables are used directly (they may be shared), whereas a
+        # restricted region is copied so that it is contiguous and so that
+        # only it needs to be held in memory
+        if self._bounds == full_bounds:
+            self._p_corr_active = self._p_corr
+            self._h_corr_active = self._h_corr
+        else:
+            self._p_corr_active = np.array(self._p_corr[self._i_ab])
+            self._h_corr_active = np.array(self._h_corr[self._i_ab])
+
+    def _normalise(self):
+
+        if self._log_domain:
+            self._log_p_ab -= _log_sum_exp(self._log_p_ab)
+            self._p_ab = np.exp(self._log_p_ab)
+        else:
+            self._p_ab /= np.sum(self._p_ab, dtype=np.float64)
+
+
+def calc_tables(
+    alpha_levels,
+    beta_levels,
+    stim_levels,
+    psych_func,
+    dtype=np.float64
+):
+
+    p_corr = psych_func(
+        x=np.asarray(stim_levels)[np.newaxis, np.newaxis, :],
+        alpha=np.asarray(alpha_levels)[:, np.newaxis, np.newaxis],
+        beta=np.asarray(beta_levels)[np.newaxis, :, np.newaxis]
+    )
+
+    h_corr = _binary_entropy(p_corr)
+
+    return (p_corr.astype(dtype), h_corr.astype(dtype))
+
+
+def get_tables(conf):
+
+    (cache_paths, cache_exists) = get_tables_path(conf)
+
+    if not cache_exists:
+
+        tables = calc_tables(
+            alpha_levels=conf.alpha_levels,
+            beta_levels=conf.beta_levels,
+            stim_levels=conf.x_levels,
+            psych_func=conf.psych_func,
+            dtype=conf.psi_dtype
+        )
+
+        for (cache_path, table) in zip(cache_paths, tables):
+
+            # write to a temporary file and then move it into place, so
+            # that concurrent runs never see a partially-written table
+            (handle, temp_path) = tempfile.mkstemp(
+                suffix=".npy",
+                dir=os.path.dirname(cache_path)
+            )
+
+            with os.fdopen(handle, "wb") as temp_file:
+                np.save(temp_file, table)
+
+            os.rename(temp_path, cache_path)
+
+    # read-only and memory-mapped, so they are shared by all the staircases
+    tables = tuple(
+        np.load(cache_path, mmap_mode="r")
+        for cache_path in cache_paths
+    )
+
+    return tables
+
+
+def get_tables_key(conf):
+
+    key = hashlib.sha1()
+
+    for levels in (conf.alpha_levels, conf.beta_levels, conf.x_levels):
+        levels = np.ascontiguousarray(levels, dtype=np.float64)
+        key.update(str(levels.shape))
+        key.update(levels.tostring())
+
+    func = conf.psych_func
+
+    # unpack the partial so that its arguments contribute to the key
+    func_args = getattr(func, "args", ())
+    func_kwargs = getattr(func, "keywords", None) or {}
+    func = getattr(func, "func", func)
+
+    key.update(func.__module__ + "." + func.__name__)
+    key.update(repr(func_args))
+    key.update(repr(sorted(func_kwargs.items())))
+
+    key.update(np.dtype(conf.psi_dtype).str)
+
+    return key.hexdigest()
+
+
+def get_tables_path(conf):
+
+    key = get_tables_key(conf)
+
+    cache_paths = [
+        os.path.join(
+            conf.data_path,
+            "{s:s}_psi_{k:s}_{t:s}.npy".format(
+                s=conf.study_id,
+                k=key,
+                t=table
+            )
+        )
+        for table in ("p", "h")
+    ]
+
+    cache_exists = all(
+        os.path.exists(cache_path)
+        for cache_path in cache_paths
+    )
+
+    return (cache_paths, cache_exists)
+
+
+def get_mass_bounds(p_ab, tail):
+
+    bounds = []
+
+    # the region that excludes `tail` of the mass from each end of the alpha
+    # and beta marginals
+    for sum_axis in (1, 0):
+
+        cdf = np.cumsum(np.sum(p_ab, axis=sum_axis, dtype=np.float64))
+        cdf /= cdf[-1]
+
+        i_lower = np.searchsorted(cdf, tail)
+        i_upper = min(np.searchsorted(cdf, 1.0 - tail) + 1, len(cdf))
+
+        bounds.extend([i_lower, i_upper])
+
+    return tuple(bounds)
+
+
+def _bounds_size(bounds):
+
+    return (bounds[1] - bounds[0]) * (bounds[3] - bounds[2])
+
+
+def _log_sum_exp(log_p):
+
+    log_p_max = np.max(log_p)
+
+    return log_p_max + np.log(
+        np.sum(np.exp(log_p - log_p_max), dtype=np.float64)
+    )
+
+
+def _binary_entropy(p):
+
+    # treat 0 * log(0) as 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h = -(p * np.log(p) + (1.0 - p) * np.log(1.0 - p))
+
+    h[~np.isfinite(h)] = 0.0
+
+    return h
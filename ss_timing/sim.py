@@ -0,0 +1,135 @@
+import numpy as np
+
+import ss_timing.data
+import ss_timing.exp
+import ss_timing.psi
+
+
+def run(conf, alpha, beta, rand=None, data=None, tables=None):
+
+    # simulates a full session for an observer whose psychometric function
+    # is `conf.psych_func` with the given `alpha` and `beta`
+
+    if rand is None:
+        rand = np.random
+
+    # shared by all the runs
+    if tables is None:
+        tables = get_tables(conf)
+
+    if data is None:
+        data = ss_timing.data.gen_data_table(conf, rand=rand)
+
+    for run_num in xrange(1, conf.n_runs + 1):
+
+        i_this_run = np.flatnonzero(data["run_number"] == run_num)
+
+        data[i_this_run] = run_run(
+            conf,
+            data[i_this_run],
+            alpha=alpha,
+            beta=beta,
+            rand=rand,
+            tables=tables
+        )
+
+    return data
+
+
+def run_run(
+    conf,
+    run_data,
+    alpha,
+    beta,
+    rand=None,
+    save_trial=None,
+    tables=None
+):
+
+    if rand is None:
+        rand = np.random
+
+    if tables is None:
+        tables = get_tables(conf)
+
+    psis = ss_timing.exp._get_psis(conf, tables=tables)
+
+    def run_trial(trial_data, resp_callback):
+
+        return _run_trial(
+            conf,
+            trial_data,
+            alpha=alpha,
+            beta=beta,
+            rand=rand,
+            resp_callback=resp_callback
+        )
+
+    # the same trial loop as the real experiment, but without any display or
+    # waiting between the trials; there is nothing for the staircase update to
+    # overlap with, so it isn't done in a thread
+    run_data = ss_timing.exp._run_trials(
+        conf,
+        run_data,
+        psis,
+        run_trial,
+        save_trial=save_trial,
+        wait_iti=False,
+        psi_threaded=False
+    )
+
+    return run_data
+
+
+def get_tables(conf):
+
+    # worked out in memory rather than using the cache in the data directory,
+    # so that the simulations don't need the lab machines
+    tables = ss_timing.psi.calc_tables(
+        alpha_levels=conf.alpha_levels,
+        beta_levels=conf.beta_levels,
+        stim_levels=conf.x_levels,
+        psych_func=conf.psych_func,
+        dtype=conf.psi_dtype
+    )
+
+    return tables
+
+
+def _run_trial(conf, trial_data, alpha, beta, rand, resp_callback=None):
+
+    p_corr = conf.psych_func(
+        x=trial_data["target_contrast"],
+        alpha=alpha,
+        beta=beta
+    )
+
+    if rand.uniform() < p_corr:
+        resp_pos = trial_data["target_pos"]
+    else:
+        # an incorrect response is equally likely to be any of the others
+        resp_pos = rand.choice(
+            sorted(
+                target_pos
+                for target_pos in conf.target_positions.keys()
+                if target_pos != trial_data["target_pos"]
+            )
+        )
+
+    key_map = {
+        resp_pos: key
+        for (key, resp_pos) in conf.resp_map.iteritems()
+    }
+
+    trial_data["raw_resp"] = key_map[resp_pos]
+    trial_data["response_pos"] = resp_pos
+    trial_data["response_time"] = 0.0
+
+    trial_data["correct"] = int(
+        trial_data["response_pos"] == trial_data["target_pos"]
+    )
+
+    if resp_callback is not None:
+        resp_callback(trial_data)
+
+    return trial_data
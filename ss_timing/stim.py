@@ -1,44 +1,23 @@
+import collections
 import os
 
 import psychopy.visual
 
 import stimuli.psychopy_ext
+import stimuli.utils
 
 
 def get_stim(conf, win):
 
     stim = {}
 
-    stim["surr"] = psychopy.visual.GratingStim(
-        win=win,
-        tex="sin",
-        mask="raisedCos",
-        units="deg",
-        pos=[0.0, 0.0],
-        size=[conf.surr_diam_dva] * 2,
-        sf=conf.surr_cpd,
-        ori=0.0,  # will be updated
-        phase=0.0,  # will be updated
-        contrast=conf.surr_contrast,
-        autoLog=False
-    )
+    stim["surr"] = _get_surr(conf, win)
 
-    stim["targets"] = {
-        target_pos: psychopy.visual.GratingStim(
-            win=win,
-            tex="sin",
-            mask="raisedCos",
-            units="deg",
-            pos=conf.target_positions[target_pos],
-            size=[conf.target_diam_dva] * 2,
-            sf=conf.target_cpd,
-            ori=stimuli.utils.math_to_nav_polar(conf.target_ori),
-            phase=0.0,  # will be updated
-            contrast=0.0,  # will be updated
-            autoLog=False
-        )
-        for target_pos in conf.target_positions.keys()
-    }
+    stim["targets"] = _get_targets(conf, win)
+
+    # versions of the surround and targets that are set up in advance for each
+    # orientation and phase
+    stim["gratings"] = GratingCache(conf, win)
 
     stim["rings"] = [
         psychopy.visual.Circle(
@@ -85,3 +64,108 @@ def get_stim(conf, win):
     )
 
     return stim
+
+
+class GratingCache(object):
+
+    def __init__(self, conf, win, max_size=None):
+
+        if max_size is None:
+            max_size = conf.grating_cache_size
+
+        self._conf = conf
+        self._win = win
+        self._max_size = max_size
+
+        # ordered from least to most recently used
+        self._gratings = collections.OrderedDict()
+
+    def get(self, surr_ori, i_phase):
+
+        key = (surr_ori, i_phase)
+
+        try:
+            gratings = self._gratings.pop(key)
+
+        except KeyError:
+
+            gratings = self._build(surr_ori, i_phase)
+
+            while len(self._gratings) >= self._max_size:
+                self._gratings.popitem(last=False)
+
+        self._gratings[key] = gratings
+
+        return gratings
+
+    def build_all(self):
+
+        for surr_ori in self._conf.surr_oris:
+            for i_phase in xrange(self._conf.n_grating_phases):
+                self.get(surr_ori, i_phase)
+
+    def _build(self, surr_ori, i_phase):
+
+        grating_phase = float(i_phase) / self._conf.n_grating_phases
+
+        surr = _get_surr(self._conf, self._win)
+
+        surr.phase = grating_phase
+        surr.ori = stimuli.utils.math_to_nav_polar(surr_ori)
+
+        targets = _get_targets(self._conf, self._win)
+
+        for target in targets.values():
+            # not entirely sure why, but 0.5 needs to be added to the target
+            # phase so that it stays aligned with the surround
+            target.phase = grating_phase + 0.5
+
+        # draw them once so that any updates that are deferred until drawing
+        # happen now, rather than during a trial
+        surr.draw()
+        _ = [target.draw() for target in targets.values()]
+
+        self._win.clearBuffer()
+
+        return (surr, targets)
+
+
+def _get_surr(conf, win):
+
+    surr = psychopy.visual.GratingStim(
+        win=win,
+        tex="sin",
+        mask="raisedCos",
+        units="deg",
+        pos=[0.0, 0.0],
+        size=[conf.surr_diam_dva] * 2,
+        sf=conf.surr_cpd,
+        ori=0.0,  # will be updated
+        phase=0.0,  # will be updated
+        contrast=conf.surr_contrast,
+        autoLog=False
+    )
+
+    return surr
+
+
+def _get_targets(conf, win):
+
+    targets = {
+        target_pos: psychopy.visual.GratingStim(
+            win=win,
+            tex="sin",
+            mask="raisedCos",
+            units="deg",
+            pos=conf.target_positions[target_pos],
+            size=[conf.target_diam_dva] * 2,
+            sf=conf.target_cpd,
+            ori=stimuli.utils.math_to_nav_polar(conf.target_ori),
+            phase=0.0,  # will be updated
+            contrast=0.0,  # will be updated
+            autoLog=False
+        )
+        for target_pos in conf.target_positions.keys()
+    }
+
+    return targets